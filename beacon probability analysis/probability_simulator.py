@@ -0,0 +1,217 @@
+"""
+Vectorized version of smart_probability.py: simulates how many pings are needed before the average noise (raw,
+or left after the denoising guess of part4.estimated_beacon_position) falls within the tolerance.
+
+Every simulated beacon is run exactly as in smart_probability.py, but a whole batch of beacons advances one group
+of pings at a time with numpy, and the batches are spread over processes. The results are written as JSON (summary
+and histogram of both simulations) and/or CSV (one row per number of pings), e.g. to re-tune PING_THRESHOLD after a
+change of the noise model:
+
+    python3 probability_simulator.py --trials 1000000 --json results.json --csv results.csv
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import time
+import numpy as np
+
+################### command panel ~defaults of the command line options, same as smart_probability.py~
+ACCEPTED_POSSIBILITIES = 0.1 # Percentage under which a number of pings is not printed
+MAX_TESTINGS = 1000000 # Simulated beacons
+TOTAL_TIMES = 3 # Pings received at each position when multiple pings are enabled
+DISTANCE_MAX = 2000 # Distances between MELVIN and the beacon when a ping is received
+DISTANCE_MIN = 0
+TOLERANCE = 37.5 # Accepted average error
+WALL = 3 # Minimal number of positions (of groups of TOTAL_TIMES pings with multiple pings)
+NOISE_BASE = 3 * 75 # Noise of a ping: k * (NOISE_BASE + NOISE_SLOPE * (d + 1)), k uniform on [-1, 1]
+NOISE_SLOPE = 0.1
+################# end of command panel
+
+LIMIT = 1000 # Pings after which a beacon is given up (not resolved)
+BATCH_SIZE = 200000 # Beacons simulated together, bounds the memory of a worker
+
+
+def simulate_batch(trials, seed, denoise, params):
+    """
+    Simulates a batch of beacons, one group of pings (one position) at a time for all the unresolved ones.
+
+    :param trials: Number of beacons.
+    :param seed: Seed of the batch random generator.
+    :param denoise: False for the raw noise, True for the error left by the denoising guess.
+    :param params: Dictionary of the simulation parameters (see parse_args).
+    :return: (outcomes, useless): pings needed by each beacon (0 if stopped by focusing, -1 if unresolved after
+             LIMIT pings) and the total number of pings giving a distance out of range.
+    """
+    rng = np.random.default_rng(seed)
+    multiple = params["multiple"]
+    per_group = params["total_times"] if multiple else 1
+    focus_stop = params["wall"] * params["total_times"] + params["total_times"]
+    min_pings = params["wall"] * params["total_times"] if multiple else params["wall"]
+
+    outcomes = np.full(trials, -1, dtype=np.int64)
+    sums = np.zeros(trials)
+    pings = np.zeros(trials, dtype=np.int64)
+    active = np.arange(trials)
+    useless = 0
+    while active.size:
+        distance = rng.integers(params["distance_min"], params["distance_max"] + 1, size=active.size)[:, None]
+        test = np.round(rng.uniform(-1, 1, (active.size, per_group)), 3)
+        noise = test * (params["noise_base"] + (distance + 1) * params["noise_slope"])
+        if denoise:
+            trick = np.round(rng.uniform(-1, 1, (active.size, per_group)), 3)
+            noisy = distance + noise
+            error = distance - np.round(noisy - trick * (3 * 75 + 0.4 * (noisy + 1)) / 4) # Error of the estimated distance
+            contribution = (error + noise) / 2 if params["average_trick"] else error
+        else:
+            error = noise
+            contribution = noise
+        useless += int(np.count_nonzero((distance + error > params["distance_max"]) | (distance + error < 0)))
+
+        total = sums[active] + contribution.sum(axis=1)
+        total = np.round(total / params["total_times"], 2) if multiple else np.round(total, 2)
+        count = pings[active] + per_group
+
+        focused = (count == focus_stop) if params["focusing"] else np.zeros(active.size, dtype=bool)
+        found = ~focused & (np.abs(total / count) < params["tolerance"]) & (count >= min_pings)
+        outcomes[active[found]] = count[found]
+        outcomes[active[focused]] = 0
+        given_up = ~found & ~focused & (count >= LIMIT)
+
+        sums[active], pings[active] = total, count
+        sums[active[found]] = 0
+        active = active[~(found | focused | given_up)]
+    return outcomes, useless
+
+
+def _run_batch(task):
+    """
+    Pool entry point.
+    """
+    return simulate_batch(*task)
+
+
+def simulate(denoise, params, workers=None, seed=None):
+    """
+    Runs params["trials"] beacons in batches over a process pool.
+
+    :return: Dictionary of the results: trials, resolved, focused, unresolved, average/best/worst pings of the
+             resolved beacons, useless pings per beacon, pings needed by 50/90/95/99% of the beacons, histogram
+             {pings: beacons} and execution time.
+    """
+    start = time.time()
+    sizes = [BATCH_SIZE] * (params["trials"] // BATCH_SIZE)
+    if params["trials"] % BATCH_SIZE:
+        sizes.append(params["trials"] % BATCH_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(size, batch_seed, denoise, params) for size, batch_seed in zip(sizes, seeds)]
+    if workers == 1 or len(tasks) == 1:
+        results = [_run_batch(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_run_batch, tasks)
+
+    outcomes = np.concatenate([batch for batch, _ in results])
+    useless = sum(batch_useless for _, batch_useless in results)
+    resolved = outcomes[outcomes > 0]
+    histogram = np.bincount(resolved, minlength=1)
+    cumulative = np.cumsum(histogram) / len(outcomes)
+    return {
+        "denoise": denoise,
+        "trials": len(outcomes),
+        "resolved": len(resolved),
+        "focused": int(np.count_nonzero(outcomes == 0)),
+        "unresolved": int(np.count_nonzero(outcomes < 0)),
+        "average_pings": float(resolved.mean()) if len(resolved) else None,
+        "best_pings": int(resolved.min()) if len(resolved) else None,
+        "worst_pings": int(resolved.max()) if len(resolved) else None,
+        "useless_per_trial": useless / len(outcomes),
+        "pings_for": {f"{share:g}": (int(np.searchsorted(cumulative, share / 100)) if cumulative[-1] >= share / 100 else None)
+                      for share in (50, 90, 95, 99)},
+        "histogram": {int(count): int(beacons) for count, beacons in enumerate(histogram) if beacons},
+        "seconds": round(time.time() - start, 2),
+    }
+
+
+def write_csv(results, path):
+    """
+    Writes the histograms as CSV rows: simulation, pings, beacons, percentage, cumulative percentage.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["simulation", "pings", "beacons", "percentage", "cumulative_percentage"])
+        for result in results:
+            cumulative = 0
+            for count, beacons in result["histogram"].items():
+                cumulative += beacons
+                writer.writerow(["denoised" if result["denoise"] else "raw", count, beacons,
+                                 round(beacons / result["trials"] * 100, 4), round(cumulative / result["trials"] * 100, 4)])
+
+
+def print_summary(result, tolerance):
+    """
+    Prints the results of a simulation as smart_probability.py writes them.
+    """
+    print(f"\n---------- {'WITH' if result['denoise'] else 'WITHOUT'} TRYING TO REMOVE THE NOISE ----------")
+    if result["average_pings"] is not None:
+        print(f"The total average pings_quantity needed is {round(result['average_pings'], 2)} and best performance noticed : "
+              f"{result['best_pings']} and worst performance noticed : {result['worst_pings']} and pings irrational : "
+              f"{round(result['useless_per_trial'], 2)}")
+    print(f"Pings needed by 50/90/95/99% of the beacons: {list(result['pings_for'].values())}, "
+          f"{result['focused']} stopped by focusing, {result['unresolved']} unresolved after {LIMIT} pings")
+    for count, beacons in result["histogram"].items():
+        chance = beacons / result["trials"] * 100
+        if round(chance, 3) > ACCEPTED_POSSIBILITIES:
+            print(f"|{count}| pings found the target with average mistake of |{2 * tolerance}| for |{beacons}| beacons, "
+                  f"chance = |{round(chance, 2)}%|")
+    print(f"Execution time: {result['seconds']} seconds")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the pings needed to locate a beacon.")
+    parser.add_argument("--trials", type=int, default=MAX_TESTINGS, help="simulated beacons")
+    parser.add_argument("--total-times", type=int, default=TOTAL_TIMES, help="pings at each position")
+    parser.add_argument("--single-ping", action="store_true", help="one ping per position (TOTAL_TIMES disabled)")
+    parser.add_argument("--distance-min", type=int, default=DISTANCE_MIN)
+    parser.add_argument("--distance-max", type=int, default=DISTANCE_MAX)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="accepted average error")
+    parser.add_argument("--wall", type=int, default=WALL, help="minimal number of positions")
+    parser.add_argument("--focusing", action="store_true", help="stop each beacon after WALL + 1 positions")
+    parser.add_argument("--no-average-trick", action="store_true", help="do not average the denoised and raw errors")
+    parser.add_argument("--noise-base", type=float, default=NOISE_BASE)
+    parser.add_argument("--noise-slope", type=float, default=NOISE_SLOPE)
+    parser.add_argument("--workers", type=int, help="processes (default: one per core)")
+    parser.add_argument("--seed", type=int, help="seed, for reproducible results")
+    parser.add_argument("--json", help="JSON file of the results")
+    parser.add_argument("--csv", help="CSV file of the histograms")
+    args = parser.parse_args()
+    params = {
+        "trials": args.trials,
+        "total_times": args.total_times,
+        "multiple": not args.single_ping,
+        "distance_min": args.distance_min,
+        "distance_max": args.distance_max,
+        "tolerance": args.tolerance,
+        "wall": args.wall,
+        "focusing": args.focusing,
+        "average_trick": not args.no_average_trick,
+        "noise_base": args.noise_base,
+        "noise_slope": args.noise_slope,
+    }
+    return args, params
+
+
+def main():
+    args, params = parse_args()
+    results = [simulate(denoise, params, args.workers, args.seed) for denoise in (False, True)]
+    for result in results:
+        print_summary(result, params["tolerance"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"parameters": params, "results": results}, f, indent=2)
+    if args.csv:
+        write_csv(results, args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 from bitarray import bitarray
 import zlib
 import struct
+import numpy as np
 from PIL import Image
 
 DEBUG = True
 Image.MAX_IMAGE_PIXELS = 933120000
 
+ROWS_PER_BAND = 512 # Rows converted at once, a multiple of 8 so that the packed bands follow each other exactly
+
 
 
 class BitMatrix:
@@ -178,6 +181,27 @@ class BitMatrix:
 
 
 
+def canvas_to_bitmatrix(canvas, rows_per_band=ROWS_PER_BAND):
+    """
+    Builds the BitMatrix of the non-black pixels of a (height, width, 3) array (a decoded map, the memmapped
+    canvas of src/canvas_store.py...), band by band with numpy instead of pixel by pixel.
+
+    :param canvas: (height, width, 3) uint8 array.
+    :param rows_per_band: Rows converted at once (a multiple of 8).
+    :return: The BitMatrix.
+    """
+    height, width = canvas.shape[:2]
+    bitmatrix = BitMatrix(width, height)
+    bitmatrix.data = bitarray()
+    for y in range(0, height, rows_per_band):
+        band = np.asarray(canvas[y:y + rows_per_band])
+        covered = (band[..., 0] | band[..., 1] | band[..., 2]) != 0 # Not completely black
+        bitmatrix.data.frombytes(np.packbits(covered.ravel()).tobytes()) # Same bit order as bitarray
+        bitmatrix.points_taken += int(np.count_nonzero(covered))
+    del bitmatrix.data[width * height:] # Padding of the last byte
+    return bitmatrix
+
+
 def image_to_bitmatrix(image_path, output_file, compress=False):
     
     """
@@ -198,15 +222,7 @@ def image_to_bitmatrix(image_path, output_file, compress=False):
     if width != 21600 or height != 10800:
         raise ValueError(f"Image size must be 21600x10800, but got {width}x{height}")
     
-    bitmatrix = BitMatrix(width, height)
-    pixels = image.load()
-    
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            if (r, g, b) != (0, 0, 0):  # Check if pixel is NOT completely black
-                bitmatrix.set_bit(x, y, 1)
-                bitmatrix.points_taken += 1
+    bitmatrix = canvas_to_bitmatrix(np.asarray(image))
     
     bitmatrix.save_to_file(output_file, compress)
     print(f"BitMatrix saved to {output_file}")
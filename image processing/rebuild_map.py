@@ -0,0 +1,159 @@
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from canvas_store import open_canvas, MAP_WIDTH, MAP_HEIGHT
+from photo_pipeline import LENS_SIZE
+from toroidal_paste import paste
+from quality_layer import open_quality, quality_file, photo_quality
+from png_stream import write_png
+
+IMAGE_NAME = re.compile(r"lens(\d)_(-?\d+)_(-?\d+)\.(jpg|png)$") # Photos as saved by melvin: lens{precision}_{x}_{y}.jpg
+CHUNK_SIZE = 4 # Images handed at once to a decode worker
+CHECKPOINT_EVERY = 50 # Images pasted between two progress checkpoints
+
+
+def index_images(folder, region=None):
+    """
+    Indexes the photos of a folder by position, in capture order (modification time). A photo at the same position
+    and with the same lens as an older one would not improve any pixel (see quality_layer), so it is skipped.
+
+    :param folder: Folder of the photos.
+    :param region: (x_min, y_min, x_max, y_max) limits of the top left corners to keep, None for the whole map.
+    :return: List of (name, x, y, size).
+    """
+    entries = []
+    for entry in os.scandir(folder):
+        match = IMAGE_NAME.match(entry.name)
+        if match is None or not entry.is_file():
+            continue
+        size = LENS_SIZE.get(match.group(1))
+        if size is None:
+            continue
+        entries.append((entry.stat().st_mtime, entry.name, int(match.group(2)), int(match.group(3)), size))
+    entries.sort()
+
+    if region is not None and entries:
+        xs = np.array([entry[2] for entry in entries])
+        ys = np.array([entry[3] for entry in entries])
+        keep = (region[0] <= xs) & (xs <= region[2]) & (region[1] <= ys) & (ys <= region[3])
+        entries = [entry for entry, kept in zip(entries, keep) if kept]
+
+    seen = set() # (x, y, size) already photographed
+    index = []
+    for _, name, x, y, size in entries:
+        if (x % MAP_WIDTH, y % MAP_HEIGHT, size) not in seen:
+            seen.add((x % MAP_WIDTH, y % MAP_HEIGHT, size))
+            index.append((name, x, y, size))
+    return index
+
+
+def load_progress(progress_path):
+    """
+    Returns the names of the photos already on the canvas.
+    """
+    if not os.path.exists(progress_path):
+        return set()
+    with open(progress_path) as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def _decode(task):
+    """
+    Reads and resizes a photo (in a pool worker).
+    """
+    path, size = task
+    img = cv2.imread(path)
+    if img is not None and img.shape[:2] != (size, size):
+        img = cv2.resize(img, (size, size))
+    return img
+
+
+def rebuild(folder, canvas_path, output=None, progress_path=None, workers=None, region=None, fresh=False):
+    """
+    Stitches every photo of a folder onto a raw canvas and optionally exports it as PNG.
+
+    Photos are decoded by a process pool and pasted in capture order by this process (wrapping around the map),
+    each pixel only where it is better than the stitched one (see quality_layer).
+    The canvas is flushed and the pasted names are appended to the progress file every CHECKPOINT_EVERY photos,
+    so an interrupted rebuild resumes where it stopped.
+
+    :param folder: Folder of the photos.
+    :param canvas_path: Raw canvas file, an existing one is completed.
+    :param output: Path of the PNG to export, None to only update the canvas.
+    :param progress_path: File listing the photos already pasted, next to the canvas by default.
+    :param workers: Decode processes, one per core by default.
+    :param region: (x_min, y_min, x_max, y_max) limits of the top left corners to keep.
+    :param fresh: Start from a black canvas, forgetting any previous progress.
+    :return: The number of photos pasted.
+    """
+    if progress_path is None:
+        progress_path = canvas_path + ".progress"
+    if fresh:
+        for path in (canvas_path, quality_file(canvas_path), progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    index = index_images(folder, region)
+    done = load_progress(progress_path)
+    todo = [entry for entry in index if entry[0] not in done]
+    print(f"[REBUILD] {len(index)} photos indexed, {len(index) - len(todo)} already stitched, {len(todo)} to go")
+
+    canvas = open_canvas(canvas_path, 'r+')
+    quality = open_quality(quality_file(canvas_path), 'r+')
+    pasted, failed = 0, 0
+    start_time = time.monotonic()
+    with multiprocessing.Pool(workers) as pool, open(progress_path, "a") as progress:
+        checkpoint = []
+        tasks = [(os.path.join(folder, name), size) for name, _, _, size in todo]
+        # imap keeps the capture order, so overlapping photos are pasted as in an uninterrupted rebuild
+        for (name, x, y, size), img in zip(todo, pool.imap(_decode, tasks, chunksize=CHUNK_SIZE)):
+            if img is None:
+                failed += 1
+                print(f"[REBUILD] Could not read {name}")
+            else:
+                paste(canvas, img, x, y, quality=quality, img_quality=photo_quality(size, size))
+                pasted += 1
+            checkpoint.append(name)
+
+            if len(checkpoint) >= CHECKPOINT_EVERY:
+                canvas.flush() # The pixels reach the disk before the names are recorded
+                quality.flush()
+                progress.write("\n".join(checkpoint) + "\n")
+                progress.flush()
+                checkpoint = []
+                print(f"[REBUILD] {pasted + failed}/{len(todo)} ({(pasted + failed) / (time.monotonic() - start_time):.1f} photos/s)")
+        canvas.flush()
+        quality.flush()
+        if checkpoint:
+            progress.write("\n".join(checkpoint) + "\n")
+
+    print(f"[REBUILD] {pasted} photos stitched, {failed} unreadable, in {time.monotonic() - start_time:.1f} s")
+    if output:
+        size = write_png(canvas, output)
+        print(f"[REBUILD] Map saved to {output} ({size / 1e6:.1f} MB)")
+    return pasted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuilds the stitched map from a folder of photos.")
+    parser.add_argument("images", help="folder of the photos (lens{precision}_{x}_{y}.jpg)")
+    parser.add_argument("--canvas", default="rebuild_canvas.raw", help="raw canvas file, completed if it exists")
+    parser.add_argument("--output", help="PNG of the map to export when done")
+    parser.add_argument("--progress", help="progress file (default: next to the canvas)")
+    parser.add_argument("--workers", type=int, help="decode processes (default: one per core)")
+    parser.add_argument("--region", type=int, nargs=4, metavar=("X_MIN", "Y_MIN", "X_MAX", "Y_MAX"),
+                        help="only the photos with their top left corner in this region")
+    parser.add_argument("--fresh", action="store_true", help="start from a black canvas")
+    args = parser.parse_args()
+    rebuild(args.images, args.canvas, args.output, args.progress, args.workers, args.region, args.fresh)
+
+
+if __name__ == "__main__":
+    main()
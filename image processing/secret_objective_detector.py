@@ -24,7 +24,22 @@ def extract_region_wrapped(image, center_x, center_y, size):
     return region
 
 
-def find_sprite(stitched_map_path, input_photo_path):
+def load_stitched_map(stitched_map_path, map_width=21600, map_height=10800):
+    """
+    Loads the stitched map. A raw canvas file (as written by the stitching process of src/part4.py) is
+    memory-mapped read-only, so only the pages around the compared regions are ever read.
+
+    :param stitched_map_path: File path to the stitched map (.png/.jpg image or .raw canvas).
+    :return: The stitched map as a NumPy array (or memmap), None if it could not be loaded.
+    """
+    if stitched_map_path.endswith(".raw"):
+        if not os.path.exists(stitched_map_path):
+            return None
+        return np.memmap(stitched_map_path, dtype=np.uint8, mode='r', shape=(map_height, map_width, 3))
+    return cv2.imread(stitched_map_path)
+
+
+def find_sprite(stitched_map_path, input_photo_path, stitched_map=None):
     """
     Compares an input photo to the corresponding region in a stitched map image, using SSIM to detect 
     if an sprite (alteration) is present. If differences are found and SSIM is low, returns the bounding 
@@ -32,6 +47,7 @@ def find_sprite(stitched_map_path, input_photo_path):
 
     :param stitched_map_path: File path to the large stitched map image.
     :param input_photo_path: File path to the smaller input photo which may contain an sprite.
+    :param stitched_map: The already loaded stitched map, to avoid loading it again for every photo.
     :return: A tuple (min_x, min_y, max_x, max_y) representing the bounding box of detected sprite zone
              on the stitched map, or an empty list if no sprite is detected.
     """
@@ -49,7 +65,8 @@ def find_sprite(stitched_map_path, input_photo_path):
         raise ValueError("Invalid lens code: {}".format(lens_code))
     size = lens_sizes[lens_code]
 
-    stitched_map = cv2.imread(stitched_map_path)
+    if stitched_map is None:
+        stitched_map = load_stitched_map(stitched_map_path, map_width, map_height)
     input_photo = cv2.imread(input_photo_path)
 
     if stitched_map is None:
@@ -104,18 +121,19 @@ def find_sprite(stitched_map_path, input_photo_path):
 
 
 if __name__ == '__main__':
-    stitched_map_path = "" # Fill with the stitched map path here
+    stitched_map_path = "" # Fill with the stitched map path here (.png or the .raw canvas of the stitching process)
     folder_path = ""  # Fill with your images folder path here
 
     max_x = 0
     max_y = 0
     min_x = 30000
     min_y = 20000
+    stitched_map = load_stitched_map(stitched_map_path)
     for filename in os.listdir(folder_path):
         if filename.endswith(".jpg") or filename.endswith(".png"):
             full_path = os.path.join(folder_path, filename)
             try:
-                coords = find_sprite(stitched_map_path, full_path)
+                coords = find_sprite(stitched_map_path, full_path, stitched_map)
                 if coords:
                     x1, y1, x2, y2 = coords
                     max_x = max(max_x, x2)
@@ -1,6 +1,11 @@
 import cv2
 import numpy as np
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from toroidal_paste import paste
+from quality_layer import open_quality, quality_file, photo_quality
 
 LIMITATIONS = []
 
@@ -31,49 +36,47 @@ def stitch_image(name):
     img = cv2.imread(path + name)
     img = cv2.resize(img, (lens, lens))
 
-    # Get image dimensions
-    h, w = img.shape[:2]
-
-    # Make sure the position is valid on our canvas
-    if canvas_x < 0 or canvas_y < 0 or canvas_x + w > 21600 or canvas_y + h > 10800:
-      # Handle edge cases by clipping to canvas boundaries
-      # Calculate valid portion of the image and valid position on canvas
-      start_x = max(0, -canvas_x)
-      start_y = max(0, -canvas_y)
-      end_x = min(w, 21600 - canvas_x)
-      end_y = min(h, 10800 - canvas_y)
-      
-      # Adjust canvas position to be within bounds
-      valid_canvas_x = max(0, canvas_x)
-      valid_canvas_y = max(0, canvas_y)
-      
-      # Extract valid portion of image
-      valid_img = img[start_y:end_y, start_x:end_x]
-      
-      # Calculate valid dimensions
-      valid_h, valid_w = valid_img.shape[:2]
-      
-      # Place the valid portion onto the canvas
-      canvas[valid_canvas_y:valid_canvas_y+valid_h, valid_canvas_x:valid_canvas_x+valid_w] = valid_img
-      
-    else:
-      # Normal case - place the entire image
-      canvas[canvas_y:canvas_y+h, canvas_x:canvas_x+w] = img
-
+    # Wrapping around the map, the parts crossing an edge come back on the other side, each pixel only where
+    # it is better than the stitched one (same result as the StitchEngine path)
+    paste(canvas, img, canvas_x, canvas_y, quality=quality, img_quality=photo_quality(lens, lens))
 
-canvas = np.zeros((10800, 21600, 3), dtype=np.uint8)
 
 path = "" # Fill with the path to the folder that contains the images
 
+canvas_path = "" # Fill with the path to a raw canvas file (e.g. the "stitched_canvas.raw" of src) to stitch on disk, leave empty to stitch in RAM
+
+if canvas_path:
+  # Same layout as src/canvas_store.py, an existing canvas is reused and completed instead of rebuilt from scratch
+  canvas = np.memmap(canvas_path, dtype=np.uint8, mode='r+' if os.path.exists(canvas_path) else 'w+', shape=(10800, 21600, 3))
+  quality = open_quality(quality_file(canvas_path), 'r+') # Quality layer next to the canvas (see src/quality_layer.py)
+else:
+  canvas = np.zeros((10800, 21600, 3), dtype=np.uint8)
+  quality = np.zeros((10800, 21600), dtype=np.uint8)
+
 output = "" # Fill with the path to be saved and the name of the map ending with .png (e.g. '/PathToSave/Map/map.png')
 
+workers = 0 # Band worker processes for a raw canvas (see src/stitch_engine.py), None for one per core, 0 to stitch here
+
 images = [f for f in os.listdir(path) if os.path.isfile(path + f)]
 
 
 
 # print(images)
-for image in images:
-  stitch_image(image)
+if canvas_path and workers != 0:
+  from stitch_engine import StitchEngine
+
+  canvas.flush()
+  with StitchEngine(canvas_path, workers) as engine:
+    for image in images:
+      parts = image.split('_')
+      x, y = int(parts[1]), int(parts[2][:-4])
+      if LIMITATIONS == [] or (LIMITATIONS[0] <= x <= LIMITATIONS[2] and LIMITATIONS[1] <= y <= LIMITATIONS[3]):
+        engine.submit_file(path + image, x, y) # Read, decoded and pasted by the workers, wrapping around the map
+else:
+  for image in images:
+    stitch_image(image)
+  if canvas_path:
+    quality.flush()
 
 
 def get_canvas_bytes(canvas, format='.png', quality=90):
@@ -17,6 +17,7 @@ SSH_USERNAME = "root"
 SSH_PASSWORD = "password"
 LOCAL_PORT = 8080
 MELVIN_BASE_URL = "http://10.100.10.14:33000"
+REQUEST_TIMEOUT = (3, 5)  # (connect, read) seconds for every request to MELVIN
 SCALE_FACTOR = 0.05
 MELVIN_SIZE = 7
 
@@ -28,6 +29,8 @@ class SatelliteMonitor:
     
     self.ssh_client = None
     self.tunnel = None
+    # One pooled session so the monitor does not open a new connection through the tunnel for every refresh
+    self.session = requests.Session()
     
     self.is_monitoring = False
     self.monitoring_thread = None
@@ -359,7 +362,7 @@ class SatelliteMonitor:
 
     def set_mode(mode, x, y, angle):
       payload = {"state": mode, "vel_x": x, "vel_y": y, "camera_angle": angle}
-      response = requests.put(f"{MELVIN_BASE_URL}/control", json=payload)
+      response = self.session.put(f"{MELVIN_BASE_URL}/control", json=payload, timeout=REQUEST_TIMEOUT)
       response.raise_for_status()
 
     curr = self.get_observation()
@@ -509,14 +512,14 @@ class SatelliteMonitor:
   
   def get_observation(self):
     """Retrieve MELVIN's observation data."""
-    try:
-      response = requests.get(f"{MELVIN_BASE_URL}/observation")
-      response.raise_for_status()
-      return response.json()
-    except Exception as e:
-      print(f"[ERROR] Failed to fetch observation data: {str(e)}")
-      time.sleep(2)
-      return self.get_observation()
+    while True:
+      try:
+        response = self.session.get(f"{MELVIN_BASE_URL}/observation", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+      except Exception as e:
+        print(f"[ERROR] Failed to fetch observation data: {str(e)}")
+        time.sleep(2)
   
   
   def update_satellite_data(self, observation_data):
@@ -0,0 +1,181 @@
+import numpy as np
+
+DEBUG = False
+
+MAP_WIDTH = 21600
+MAP_HEIGHT = 10800
+
+MAX_ITERATIONS = 50 # Levenberg-Marquardt iterations per solve
+STEP_TOLERANCE = 1e-2 # Pixels, a smaller step ends the solve
+INITIAL_DAMPING = 1e-3 # Levenberg-Marquardt damping of the first iteration
+NOISE_BASE = 3 * 75 # The announced distance is d + k * (NOISE_BASE + NOISE_SLOPE * (d + 1)), k uniform on [-1, 1]
+NOISE_SLOPE = 0.1
+GUESS_BASE = 3 * 75 / 4 # part4.estimated_beacon_position removes k' * (GUESS_BASE + GUESS_SLOPE * (noisy + 1)), k' uniform on [-1, 1]
+GUESS_SLOPE = 0.1
+
+
+def wrap_delta(a, b, limit):
+    """
+    Returns the signed shortest difference a - b on a circle of length limit, elementwise.
+    """
+    return (a - b + limit / 2) % limit - limit / 2
+
+
+def noise_width(distance):
+    """
+    Returns the largest noise that can be added to an actual distance (elementwise).
+    """
+    return NOISE_BASE + NOISE_SLOPE * (distance + 1)
+
+
+def distance_sigma(distance):
+    """
+    Standard deviation of the error of an estimated distance (elementwise): the announced noise plus the random
+    guess of part4.estimated_beacon_position, both uniform (variance width^2 / 3).
+    """
+    return np.sqrt((noise_width(distance) ** 2 + (GUESS_BASE + GUESS_SLOPE * (distance + 1)) ** 2) / 3)
+
+
+class BeaconEstimator:
+    '''
+    Least squares estimate of a beacon position from its pings, updated as the pings arrive.
+
+    Every ping is a circle of radius distance around MELVIN's position, on the toroidal map. Each new ping
+    warm-starts a Levenberg-Marquardt solve from the previous optimum, with vectorized residuals (weighted by the
+    known noise of each distance) and their analytic Jacobian, so it only takes a few iterations. The covariance
+    of the estimate comes from the Jacobian and the noise model, not from the residuals of a handful of pings.
+    '''
+    def __init__(self, width=MAP_WIDTH, height=MAP_HEIGHT, sigma=distance_sigma):
+        """
+        :param sigma: Function giving the standard deviation of the error of a pinged distance.
+        """
+        self.width = width
+        self.height = height
+        self.sigma = sigma
+        self._xs, self._ys, self._distances, self._weights = [], [], [], []
+        self.position = None # (x, y) estimate, None until two distinct positions were pinged
+        self.covariance = None # 2x2 covariance of the estimate
+        self.rss = None # Weighted residual sum of squares at the estimate
+
+    @property
+    def count(self):
+        """
+        Number of pings taken into account.
+        """
+        return len(self._distances)
+
+    def add(self, x, y, distance):
+        """
+        Adds a ping and updates the estimate.
+
+        :param x: X-coordinate of MELVIN when the ping was received.
+        :param y: Y-coordinate of MELVIN when the ping was received.
+        :param distance: Estimated distance to the beacon.
+        :return: The (x, y) estimate, or None while all the pings come from one position.
+        """
+        return self.add_many([(x, y, distance)])
+
+    def add_many(self, pings):
+        """
+        Adds several (x, y, distance) pings and updates the estimate once.
+        """
+        for x, y, distance in pings:
+            self._xs.append(x)
+            self._ys.append(y)
+            self._distances.append(distance)
+            self._weights.append(1 / float(self.sigma(distance)))
+        if self.position is None:
+            self.position = self._initial_guess()
+            if self.position is None:
+                return None
+        self._solve()
+        return self.position
+
+    def _initial_guess(self):
+        """
+        Center of the pinged positions, None while there is only one.
+        """
+        if len(set(zip(self._xs, self._ys))) < 2:
+            return None
+        return (min(self._xs) + max(self._xs)) / 2, (min(self._ys) + max(self._ys)) / 2
+
+    def _residuals(self, point):
+        """
+        :return: The residuals (distance from the point to each ping position minus the pinged distance, in standard
+                 deviations of its noise) and their (n, 2) Jacobian.
+        """
+        dx = wrap_delta(point[0], np.asarray(self._xs, dtype=float), self.width)
+        dy = wrap_delta(point[1], np.asarray(self._ys, dtype=float), self.height)
+        ranges = np.maximum(np.hypot(dx, dy), 1e-9)
+        weights = np.asarray(self._weights)
+        jacobian = np.column_stack((dx / ranges, dy / ranges)) * weights[:, None]
+        return (ranges - np.asarray(self._distances, dtype=float)) * weights, jacobian
+
+    def _mirror(self, point):
+        """
+        Reflects a point across the main axis of the pinged positions. MELVIN pings along its track, so the circles
+        also cross on the other side of it and the solve may settle on that mirror image.
+        """
+        xs = self._xs[0] + wrap_delta(np.asarray(self._xs, dtype=float), self._xs[0], self.width)
+        ys = self._ys[0] + wrap_delta(np.asarray(self._ys, dtype=float), self._ys[0], self.height)
+        center = np.array([xs.mean(), ys.mean()])
+        _, _, axes = np.linalg.svd(np.column_stack((xs, ys)) - center)
+        offset = np.array([wrap_delta(point[0], center[0], self.width), wrap_delta(point[1], center[1], self.height)])
+        return center + 2 * (offset @ axes[0]) * axes[0] - offset
+
+    def _solve(self):
+        """
+        Levenberg-Marquardt from the current estimate and from its mirror image (see _mirror), keeping the best
+        optimum, then updates the covariance.
+        """
+        best = None
+        for start in (np.array(self.position, dtype=float), self._mirror(self.position)):
+            point, residuals, jacobian, cost = self._descend(start)
+            if best is None or cost < best[3]:
+                best = point, residuals, jacobian, cost
+        point, residuals, jacobian, cost = best
+
+        self.position = (point[0] % self.width, point[1] % self.height)
+        self.rss = float(cost)
+        try:
+            self.covariance = np.linalg.inv(jacobian.T @ jacobian) # Residuals already in standard deviations
+        except np.linalg.LinAlgError:
+            self.covariance = np.full((2, 2), np.inf)
+        if DEBUG:
+            sigma_x, sigma_y = np.sqrt(np.diag(self.covariance))
+            print(f"[ESTIMATOR] {self.count} pings: ({self.position[0]:.0f}, {self.position[1]:.0f}) +- ({sigma_x:.0f}, {sigma_y:.0f})")
+
+    def _descend(self, point):
+        """
+        Levenberg-Marquardt iterations from a starting point.
+
+        :return: The optimum, its residuals, their Jacobian and the weighted residual sum of squares.
+        """
+        residuals, jacobian = self._residuals(point)
+        cost = residuals @ residuals
+        damping = INITIAL_DAMPING
+        for _ in range(MAX_ITERATIONS):
+            normal = jacobian.T @ jacobian
+            gradient = jacobian.T @ residuals
+            step = -np.linalg.solve(normal + damping * (np.diag(np.diag(normal)) + np.eye(2) * 1e-9), gradient)
+            candidate = point + step
+            candidate_residuals, candidate_jacobian = self._residuals(candidate)
+            candidate_cost = candidate_residuals @ candidate_residuals
+            if candidate_cost < cost:
+                point, residuals, jacobian, cost = candidate, candidate_residuals, candidate_jacobian, candidate_cost
+                damping /= 10
+                if np.hypot(*step) < STEP_TOLERANCE:
+                    break
+            else:
+                damping *= 10
+                if damping > 1e10:
+                    break
+        return point, residuals, jacobian, cost
+
+    def rounded(self):
+        """
+        Returns the estimate rounded to pixels, or None.
+        """
+        if self.position is None:
+            return None
+        return round(self.position[0]) % self.width, round(self.position[1]) % self.height
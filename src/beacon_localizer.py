@@ -0,0 +1,192 @@
+import cv2 as cv
+import numpy as np
+from beacon_estimator import wrap_delta, noise_width, MAP_WIDTH, MAP_HEIGHT, NOISE_BASE, NOISE_SLOPE
+
+DEBUG = False
+
+COARSE_CELL = 540 # Pixels, side of the cells of the first level (divides both sides of the map)
+FINE_CELL = 10 # Pixels, cells are halved until their side is at most this
+ACCEPT_RADIUS = 75 # Pixels, a guess within this distance of the beacon is accepted
+
+
+def distance_bounds(noisy):
+    """
+    Returns the (min, max) actual distances that can be announced as noisy.
+    """
+    return (noisy - NOISE_BASE - NOISE_SLOPE) / (1 + NOISE_SLOPE), (noisy + NOISE_BASE + NOISE_SLOPE) / (1 - NOISE_SLOPE)
+
+
+class GridLocalizer:
+    '''
+    Posterior of a beacon position on a grid over the toroidal map, from the exact noise model of the pings.
+
+    A ping announced as noisy from MELVIN's position only allows the beacon in the annulus of actual distances
+    distance_bounds(noisy), where its likelihood is 1 / (2 * noise_width(d)). The first ping is located coarse to fine:
+    the cells of the map that can reach the annulus are halved until they are FINE_CELL wide, so the 3.3 million fine
+    cells of the map are never built. Each next ping only filters the surviving cells and adds its log-likelihood,
+    so the estimate never lands on a local minimum, even across the edges of the map.
+    '''
+    def __init__(self, width=MAP_WIDTH, height=MAP_HEIGHT, coarse_cell=COARSE_CELL, fine_cell=FINE_CELL):
+        self.width = width
+        self.height = height
+        self.coarse_cell = coarse_cell
+        self.cell = coarse_cell # Side of the surviving cells, once refined
+        while self.cell > fine_cell:
+            self.cell /= 2
+        self.xs = None # Centers of the surviving cells, None before the first ping
+        self.ys = None
+        self.log_likelihood = None # Of each surviving cell
+        self.count = 0 # Pings taken into account
+        self.rejected = 0 # Pings incompatible with all the previous ones (ignored)
+
+    def _reachable(self, xs, ys, x, y, noisy, cell):
+        """
+        Mask of the cells of side cell containing a point at an allowed distance from the ping.
+        """
+        low, high = distance_bounds(noisy)
+        centers = np.hypot(wrap_delta(xs, x, self.width), wrap_delta(ys, y, self.height))
+        margin = cell * np.sqrt(0.5) # Half diagonal
+        return (centers - margin <= high) & (centers + margin >= low)
+
+    def _ping_log_likelihood(self, xs, ys, x, y, noisy):
+        """
+        Log-likelihood of the ping at the given points (-inf outside of its annulus).
+        """
+        distances = np.hypot(wrap_delta(xs, x, self.width), wrap_delta(ys, y, self.height))
+        widths = noise_width(distances)
+        with np.errstate(divide='ignore'):
+            return np.where(np.abs(noisy - distances) <= widths, -np.log(2 * widths), -np.inf)
+
+    def _locate(self, x, y, noisy):
+        """
+        Coarse to fine cells of the map reachable from the first ping.
+        """
+        size = self.coarse_cell
+        xs, ys = np.meshgrid(np.arange(self.width // size) * size + size / 2,
+                             np.arange(self.height // size) * size + size / 2)
+        xs, ys = xs.ravel(), ys.ravel()
+        while True:
+            keep = self._reachable(xs, ys, x, y, noisy, size)
+            xs, ys = xs[keep], ys[keep]
+            if size <= self.cell:
+                return xs, ys
+            size /= 2
+            quarter = size / 2 # Offset of the 4 children from the center of their parent
+            xs = (xs[:, None] + np.array([-quarter, quarter, -quarter, quarter])).ravel()
+            ys = (ys[:, None] + np.array([-quarter, -quarter, quarter, quarter])).ravel()
+
+    def add(self, x, y, noisy):
+        """
+        Multiplies the posterior by the likelihood of a ping.
+
+        :param x: X-coordinate of MELVIN when the ping was received.
+        :param y: Y-coordinate of MELVIN when the ping was received.
+        :param noisy: Distance announced by the beacon.
+        :return: The number of surviving cells.
+        """
+        if self.xs is None:
+            xs, ys = self._locate(x, y, noisy)
+            log_likelihood = np.zeros(len(xs))
+        else:
+            keep = self._reachable(self.xs, self.ys, x, y, noisy, self.cell)
+            xs, ys, log_likelihood = self.xs[keep], self.ys[keep], self.log_likelihood[keep]
+        if len(xs) == 0:
+            self.rejected += 1
+            if DEBUG:
+                print(f"[LOCALIZER] Ignoring ping ({x}, {y}, {noisy}), incompatible with the previous ones")
+            return 0 if self.xs is None else len(self.xs)
+
+        self.xs, self.ys = xs, ys
+        self.log_likelihood = log_likelihood + self._ping_log_likelihood(xs, ys, x, y, noisy)
+        self.count += 1
+        if DEBUG:
+            print(f"[LOCALIZER] {self.count} pings: {len(xs)} cells, {self.area():.0f} px2")
+        return len(xs)
+
+    def probabilities(self):
+        """
+        Returns the posterior probability of each surviving cell (uniform prior over the map).
+        A cell with its center just outside an annulus but still reachable keeps a small share, so that thin
+        intersections of annuli never leave an empty posterior.
+        """
+        if self.xs is None:
+            return None
+        finite = np.isfinite(self.log_likelihood)
+        if not finite.any():
+            return np.full(len(self.xs), 1 / len(self.xs))
+        weights = np.zeros(len(self.xs))
+        weights[finite] = np.exp(self.log_likelihood[finite] - self.log_likelihood[finite].max())
+        return weights / weights.sum()
+
+    def estimate(self):
+        """
+        Returns the maximum a posteriori (x, y) position rounded to pixels, or None before the first ping.
+        """
+        if self.xs is None:
+            return None
+        best = np.argmax(self.log_likelihood)
+        return round(self.xs[best]) % self.width, round(self.ys[best]) % self.height
+
+    def modes(self, count, radius=ACCEPT_RADIUS):
+        """
+        Picks guesses maximizing the probability that one of them is accepted, greedily: each guess is the point
+        holding the most posterior mass within radius, once the mass of the previous guesses has been removed
+        (which is also the posterior after those guesses missed).
+
+        The surviving cells lie on a lattice of side cell, so the mass within radius of every lattice point is a
+        convolution of the posterior, unwrapped around its first cell, with a disk.
+
+        :param count: Number of guesses.
+        :param radius: Acceptance radius of a guess.
+        :return: List of ((x, y), mass) best first, mass being the probability that this guess hits while the
+                 previous ones missed (the masses add up to the hit probability of the guesses). Shorter if the
+                 posterior is exhausted, empty before the first ping.
+        """
+        probabilities = self.probabilities()
+        if probabilities is None:
+            return []
+        columns, rows = round(self.width / self.cell), round(self.height / self.cell)
+        xs = np.round((self.xs - self.cell / 2) / self.cell).astype(np.int64)
+        ys = np.round((self.ys - self.cell / 2) / self.cell).astype(np.int64)
+        xs = xs[0] + wrap_delta(xs, xs[0], columns).astype(np.int64) # Unwrapped around the first cell
+        ys = ys[0] + wrap_delta(ys, ys[0], rows).astype(np.int64)
+        reach = int(radius // self.cell)
+        left, top = xs.min() - 2 * reach, ys.min() - 2 * reach # Margin for the disks of guesses at the border
+        grid = np.zeros((ys.max() - top + 2 * reach + 1, xs.max() - left + 2 * reach + 1), dtype=np.float32)
+        np.add.at(grid, (ys - top, xs - left), probabilities)
+
+        offsets = np.arange(-reach, reach + 1) * self.cell
+        disk = (np.hypot(*np.meshgrid(offsets, offsets)) <= radius).astype(np.float32)
+        guesses = []
+        for _ in range(count):
+            mass = cv.filter2D(grid, -1, disk, borderType=cv.BORDER_CONSTANT)
+            row, column = np.unravel_index(np.argmax(mass), mass.shape)
+            if mass[row, column] <= 0:
+                break
+            guesses.append(((round((left + column) * self.cell + self.cell / 2) % self.width,
+                             round((top + row) * self.cell + self.cell / 2) % self.height), float(mass[row, column])))
+            view = grid[row - reach:row + reach + 1, column - reach:column + reach + 1]
+            view[disk > 0] = 0 # Missed: the beacon is not around this guess
+        return guesses
+
+    def area(self):
+        """
+        Returns the area (px2) where the beacon can still be.
+        """
+        if self.xs is None:
+            return float(self.width * self.height)
+        return len(self.xs) * self.cell ** 2
+
+
+if __name__ == '__main__':
+    import time
+    rng = np.random.default_rng(0)
+    beacon = rng.uniform(0, MAP_WIDTH), rng.uniform(0, MAP_HEIGHT)
+    localizer = GridLocalizer()
+    start = time.perf_counter()
+    for ping in range(10):
+        x, y = (beacon[0] + 1500 + 300 * ping) % MAP_WIDTH, (beacon[1] - 800 + 120 * ping) % MAP_HEIGHT
+        d = np.hypot(wrap_delta(beacon[0], x, MAP_WIDTH), wrap_delta(beacon[1], y, MAP_HEIGHT))
+        localizer.add(x, y, d + rng.uniform(-1, 1) * noise_width(d))
+        print(f"{ping + 1} pings: {localizer.estimate()} (beacon at ({beacon[0]:.0f}, {beacon[1]:.0f})), "
+              f"{localizer.area():.0f} px2, {(time.perf_counter() - start) * 1e3:.1f} ms")
@@ -1,92 +1,29 @@
-import re
 import matplotlib
 
 matplotlib.use('Agg')  # Use a non-interactive backend
 import matplotlib.pyplot as plt
 import numpy as np
-from datetime import datetime
-from scipy.optimize import minimize
+from ping_store import PingStore
+from beacon_estimator import BeaconEstimator
 
 DEBUG = False
 
 
-def find_solution():
-    file_path = 'ping_log.txt'
+def find_solution(store=None, beacon_id=None):
+    """
+    Estimates the position of a beacon from its pings (the circles around MELVIN's positions).
 
-
-    with open(file_path, 'r') as file:
-        data = file.readlines()
-
-    pattern = r'\[SUCCESS\] PING for Beacon with ID: (\d+) found at (\d+) , (\d+), with actual distance: (\d+) - Timestamp: ([\d-]+\s[\d:.]+)'
+    :param store: PingStore with the pings, None to load the ping log from disk (e.g. in the safety handler).
+    :param beacon_id: Beacon to locate, None for the first beacon with enough pings.
+    :return: The rounded (x, y) estimation, or None if no beacon has enough pings.
+    """
+    if store is None:
+        store = PingStore()
 
     # Store points by ID
-    points_by_id = {}
-
-    def distance_to_circle(point, circle_center, radius):
-        dist_to_center = np.sqrt((point[0] - circle_center[0]) ** 2 + (point[1] - circle_center[1]) ** 2)
-        return abs(dist_to_center - radius)
-
-
-    def objective_function(point, unique_points):
-        x, y = point
-
-        def wrap_distance(a, b, limit):
-            direct = abs(a - b)
-            wrapped = limit - direct
-            return min(direct, wrapped)
-
-        return sum((np.sqrt(wrap_distance(x, cx, 21600)**2 + wrap_distance(y, cy, 10800)**2) - r)**2 for cx, cy, r in unique_points)
-
-
-    # Function to calculate optimal point
-    def calculate_optimal_point(points):
-        # Average radius for duplicate coordinates
-        point_dict = {}
-        for x, y, radius in points:
-            key = (x, y)
-            point_dict.setdefault(key, []).append(radius)
-
-        unique_points = [(x, y, np.mean(radii)) for (x, y), radii in point_dict.items()]
-
-        if len(unique_points) < 2:
-            return None  # Need at least 2 unique points for triangulation
-
-        # Initial guess for optimization
-        x_coords = [p[0] for p in unique_points]
-        y_coords = [p[1] for p in unique_points]
-
-        x_min, x_max = min(x_coords), max(x_coords)
-        y_min, y_max = min(y_coords), max(y_coords)
-        initial_guess = [(x_min + x_max) / 2, (y_min + y_max) / 2]
-
-        result = minimize(objective_function, initial_guess, args=(unique_points,), method='BFGS')
-        return result.x
-
-
-    for line in data:
-        match = re.search(pattern, line)
-        if match:
-            device_id, x, y, radius, timestamp = match.groups()
-
-            # Convert to integers
-            x = int(x)
-            y = int(y)
-            radius = int(radius)
-
-            # Group by device_id
-            if device_id not in points_by_id:
-                points_by_id[device_id] = []
-
-            # Add new ping data
-            points_by_id[device_id].append((x, y, radius))
-
-            # Calculate new optimal point after each ping
-            optimal_point = calculate_optimal_point(points_by_id[device_id])
-
-            if DEBUG and optimal_point is not None:
-                print(f"[ID: {device_id}] New ping at ({x}, {y}) with radius {radius} - "
-                    f"Updated optimal point: ({optimal_point[0]:.2f}, {optimal_point[1]:.2f}) - "
-                    f"Total pings: {len(points_by_id[device_id])}")
+    beacon_ids = store.beacons() if beacon_id is None else [beacon_id]
+    points_by_id = {device_id: [(ping["x"], ping["y"], ping["distance"]) for ping in store.pings(device_id)]
+                    for device_id in beacon_ids}
 
     # Create final plots for each ID
     for device_id, points in points_by_id.items():
@@ -95,7 +32,8 @@ def find_solution():
                 print(f"\nDevice {device_id}: Not enough data points for triangulation.")
             continue
 
-        optimal_point = calculate_optimal_point(points)
+        estimator = BeaconEstimator()
+        optimal_point = estimator.add_many(points)
         if optimal_point is None:
             if DEBUG:
                 print(f"\nDevice {device_id}: Could not calculate optimal point.")
@@ -146,7 +84,7 @@ def find_solution():
             # Close the figure to free memory
             plt.close(fig)
             
-        return round(optimal_point[0]), round(optimal_point[1])
+        return estimator.rounded()
 
 if __name__ == '__main__':
     find_solution()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import time
+import cv2
+import numpy as np
+from png_stream import png_chunks, write_png
+
+DEBUG = False
+
+MAP_WIDTH = 21600
+MAP_HEIGHT = 10800
+
+CANVAS_FILE = "stitched_canvas.raw" # Raw 10800x21600x3 uint8 (BGR) file backing the stitched map
+TILE_SIZE = 1200 # 21600x10800 -> 18x9 tiles
+TILES_FOLDER = "canvas_tiles" # Folder where the tiles of the stitched map are saved
+FLUSH_INTERVAL = 10 # Minimum seconds between two flushes of the dirty tiles
+EXPORT_REQUEST_FILE = "export_map.request" # Create this file to ask the stitcher for a full PNG
+
+
+def open_canvas(path=CANVAS_FILE, mode='r', width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Opens the on-disk stitched map as a numpy memmap. Nothing is read into RAM, pages are loaded on access.
+    The stitching process opens it with 'r+' and every other reader (submitter, sprite detector...) with 'r',
+    so they all share the same file with zero copy.
+
+    :param path: Path of the raw canvas file.
+    :param mode: 'r' for read-only, 'r+' for read/write (the file is created black if it does not exist).
+    :param width: Width of the map in pixels.
+    :param height: Height of the map in pixels.
+    :return: A (height, width, 3) uint8 memmap.
+    """
+    if mode != 'r' and not os.path.exists(path):
+        mode = 'w+' # Creates a (sparse) zero filled file
+    return np.memmap(path, dtype=np.uint8, mode=mode, shape=(height, width, 3))
+
+
+class TiledCanvas:
+    '''
+    The global stitched map, split into square tiles for persistence.
+    Only the tiles touched by a stitch are marked dirty and written to disk on flush.
+    By default the canvas is a memmap of CANVAS_FILE, so a flush only writes back its dirty pages and the map
+    survives a crash of the process. Without a path, the canvas lives in RAM and each dirty tile is saved as a
+    small PNG inside the tiles folder.
+    The full map PNG is assembled on demand only.
+    '''
+    def __init__(self, width=MAP_WIDTH, height=MAP_HEIGHT, tile_size=TILE_SIZE, folder=TILES_FOLDER, path=CANVAS_FILE):
+        """
+        Initializes the canvas and its tile bookkeeping.
+
+        :param width: Width of the map in pixels.
+        :param height: Height of the map in pixels.
+        :param tile_size: Side of the square tiles in pixels.
+        :param folder: Folder where the tiles are saved (only used without a path).
+        :param path: Path of the raw canvas file, None to keep the canvas in RAM.
+        """
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.folder = folder
+        self.path = path
+        if path is not None:
+            self.canvas = open_canvas(path, 'r+', width, height)
+        else:
+            self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+
+    def _tile_path(self, row, col):
+        """
+        Returns the file path of the tile at (row, col).
+        """
+        return os.path.join(self.folder, f"tile_{row}_{col}.png")
+
+    def _tile_bounds(self, row, col):
+        """
+        Returns the (y_min, y_max, x_min, x_max) pixel bounds of the tile at (row, col).
+        """
+        y_min = row * self.tile_size
+        x_min = col * self.tile_size
+        return y_min, min(y_min + self.tile_size, self.height), x_min, min(x_min + self.tile_size, self.width)
+
+    def mark_dirty(self, x, y, w, h):
+        """
+        Marks every tile overlapping the rectangle with top left corner (x, y) and size w x h as dirty.
+
+        :param x: X-coordinate of the top left corner on the canvas.
+        :param y: Y-coordinate of the top left corner on the canvas.
+        :param w: Width of the rectangle.
+        :param h: Height of the rectangle.
+        """
+        if w <= 0 or h <= 0:
+            return
+        for row in range(y // self.tile_size, (y + h - 1) // self.tile_size + 1):
+            for col in range(x // self.tile_size, (x + w - 1) // self.tile_size + 1):
+                self.dirty.add((row, col))
+
+    def flush(self, force=False):
+        """
+        Writes the dirty tiles to disk. Unless forced, it does nothing if the last flush was less than
+        FLUSH_INTERVAL seconds ago, so that bursts of images are written once.
+
+        :param force: If True, flushes regardless of the debounce timer.
+        :return: The number of tiles written.
+        """
+        if not self.dirty:
+            return 0
+        if not force and time.monotonic() - self.last_flush < FLUSH_INTERVAL:
+            return 0
+
+        written = len(self.dirty)
+        if self.path is not None:
+            self.canvas.flush() # Only the dirty pages reach the disk
+        else:
+            os.makedirs(self.folder, exist_ok=True)
+            for row, col in sorted(self.dirty):
+                y_min, y_max, x_min, x_max = self._tile_bounds(row, col)
+                cv2.imwrite(self._tile_path(row, col), self.canvas[y_min:y_max, x_min:x_max])
+
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+        if DEBUG:
+            print(f"[CANVAS] Flushed {written} tiles")
+        return written
+
+    def load(self):
+        """
+        Restores the canvas from the tiles previously saved in the tiles folder.
+        A memmapped canvas needs no loading, reopening the file is enough.
+
+        :return: The number of tiles loaded.
+        """
+        if self.path is not None or not os.path.isdir(self.folder):
+            return 0
+        loaded = 0
+        for row in range((self.height + self.tile_size - 1) // self.tile_size):
+            for col in range((self.width + self.tile_size - 1) // self.tile_size):
+                path = self._tile_path(row, col)
+                if not os.path.exists(path):
+                    continue
+                tile = cv2.imread(path)
+                if tile is None:
+                    continue
+                y_min, y_max, x_min, x_max = self._tile_bounds(row, col)
+                self.canvas[y_min:y_max, x_min:x_max] = tile[:y_max - y_min, :x_max - x_min]
+                loaded += 1
+        return loaded
+
+    def to_png_bytes(self):
+        """
+        Assembles the whole map as PNG bytes. Prefer save_png or png_chunks, which never hold the whole PNG.
+        """
+        return b"".join(png_chunks(self.canvas))
+
+    def save_png(self, path):
+        """
+        Streams the whole map to a PNG file, a block of rows at a time.
+
+        :param path: Path of the PNG file.
+        """
+        write_png(self.canvas, path)
+
+
+def export_requested(path=EXPORT_REQUEST_FILE):
+    """
+    Checks (and consumes) an operator request for a full PNG of the map.
+
+    :param path: Path of the request file.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
@@ -1,8 +1,7 @@
-import requests
 import math
 from datetime import datetime, timedelta
 from objectives import get_and_sort_objectives
-#from observation import get_observation
+from utility import get_observation, TELEMETRY, OBSERVATION_MAX_AGE
 
 MELVIN_BASE_URL = "http://10.100.10.14:33000"
 HEADERS = {"User-Agent": "curl/7.68.0", "Content-Type": "application/json"}
@@ -15,23 +14,9 @@ FUEL_LOSS = 0.03
 
 DEBUG = False
 
-def get_observation():
-    """Retrieve MELVIN's observation data."""
-    try:
-        #print(f"[DEBUG] Sending GET request to {MELVIN_BASE_URL}/observation")
-        response = requests.get(f"{MELVIN_BASE_URL}/observation")
-        #print(f"[DEBUG] Response status code: {response.status_code}")
-        response.raise_for_status()
-        #print(f"[DEBUG] Response JSON: {response.json()}")
-        return response.json()
-    except Exception as e:
-        #print(f"[ERROR] Failed to fetch observation data: {str(e)}")
-        return get_observation()
-
-
 # Function that takes desired distance, and desired position (x,y) as arguments and returns whether MELVIN can reach that from hiw current position in time
 def time_computation(desired_dist):
-    observe = get_observation()
+    observe, received = TELEMETRY.latest(OBSERVATION_MAX_AGE)
     vel_x1 = observe['vx']
     vel_y1 = observe['vy']
     #battery = observe['battery']
@@ -47,8 +32,8 @@ def time_computation(desired_dist):
 
     # Battery unit loss per second
     if state == "acquisition":
-        # Get observation again to check for the thruster
-        obs = get_observation()
+        # Get a newer observation to check for the thruster
+        obs, _ = TELEMETRY.wait_newer(received)
         vel_x2 = obs['vx']
         vel_y2 = obs['vy']
         unit_loss = 0.15 # Battery loss when in acquisition mode
@@ -0,0 +1,215 @@
+import atexit
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+DEBUG = False
+
+RING_SLOTS = 32 # Frames buffered between melvin and the stitcher (3 MB each)
+SLOT_SIZE = 1000 # Side of a slot, the footprint of the wide lens
+NAME_BYTES = 128 # Room for the file name of a frame
+BLOCK_TIMEOUT = 30 # Seconds a blocked producer waits before dropping the new frame
+DECIMATION = 2 # Under pressure, the downsample policy keeps one frame out of DECIMATION
+HIGH_WATER = 0.75 # Fill ratio above which the downsample policy starts decimating
+POLICIES = ("block", "drop_oldest", "downsample")
+
+# Header fields (int64), each written by a single side
+HEAD, TAIL, OFFERED, DROPPED_OLDEST, DROPPED_NEWEST, DECIMATED, CONSUMED = range(7)
+HEADER_FIELDS = 7
+# Slot metadata fields (int64)
+SEQ, INDEX, HEIGHT, WIDTH, NAME_LEN = range(5)
+META_FIELDS = 5
+
+
+class FrameRing:
+    '''
+    Bounded single-producer/single-consumer ring of decoded frames in shared memory.
+
+    The producer (the commander process) writes frames into fixed SLOT_SIZE x SLOT_SIZE x 3 slots and advances
+    the head index, the consumer (the stitching process) reads them and advances the tail index. Each index has
+    a single writer, so no lock is shared between the processes. Every slot is guarded by a sequence counter
+    (seqlock): odd while being written, so a consumer that raced with an overwrite notices it and skips the frame.
+
+    When the ring is full, the policy decides:
+        block        the producer waits for a free slot (up to BLOCK_TIMEOUT, then the new frame is dropped)
+        drop_oldest  the oldest unread frame is overwritten
+        downsample   above HIGH_WATER only one frame out of DECIMATION is kept (consecutive photos overlap
+                     heavily), and when full the oldest frame is overwritten
+    Counters for the offered, consumed, dropped and decimated frames and the depth live in the shared header.
+    '''
+    def __init__(self, slots=RING_SLOTS, policy="block", name=None):
+        """
+        Creates a new ring, or attaches to an existing one by name (in the consumer process).
+
+        :param slots: Number of slots.
+        :param policy: "block", "drop_oldest" or "downsample".
+        :param name: Name of the shared memory block to attach to, None to create one.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"[ERROR] Unknown ring policy {policy}, expected one of {POLICIES}")
+        self.slots = slots
+        self.policy = policy
+        slot_bytes = SLOT_SIZE * SLOT_SIZE * 3
+        size = HEADER_FIELDS * 8 + slots * (META_FIELDS * 8 + NAME_BYTES + slot_bytes)
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            atexit.register(self.unlink)
+        else:
+            # The stitching process is a child: it shares the resource tracker of the creator, which unlinks the block
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        offset = 0
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += HEADER_FIELDS * 8
+        self.meta = np.ndarray((slots, META_FIELDS), dtype=np.int64, buffer=buf, offset=offset)
+        offset += slots * META_FIELDS * 8
+        self.names = np.ndarray((slots, NAME_BYTES), dtype=np.uint8, buffer=buf, offset=offset)
+        offset += slots * NAME_BYTES
+        self.frames = np.ndarray((slots, SLOT_SIZE, SLOT_SIZE, 3), dtype=np.uint8, buffer=buf, offset=offset)
+        if self.owner:
+            self.header[:] = 0
+            self.meta[:] = 0
+
+        self._producer_lock = threading.Lock() # Producer threads of the same process take turns
+
+    def __reduce__(self):
+        # Sent to the stitching process by name, it attaches to the same block
+        return (FrameRing, (self.slots, self.policy, self.name))
+
+    @property
+    def depth(self):
+        """
+        Number of frames waiting in the ring (approximate while both sides are running).
+        """
+        return int(min(self.header[HEAD] - self.header[TAIL], self.slots))
+
+    def counters(self):
+        """
+        Returns the counters of the ring as a dict.
+        """
+        return {
+            "depth": self.depth,
+            "offered": int(self.header[OFFERED]),
+            "consumed": int(self.header[CONSUMED]),
+            "dropped_oldest": int(self.header[DROPPED_OLDEST]),
+            "dropped_newest": int(self.header[DROPPED_NEWEST]),
+            "decimated": int(self.header[DECIMATED]),
+        }
+
+    # ---------------------------------- producer side ----------------------------------
+
+    def put(self, name, img, timeout=BLOCK_TIMEOUT):
+        """
+        Writes a frame in the ring, following the policy when it is full.
+
+        :param name: File name of the frame (it carries the lens and the position).
+        :param img: Decoded BGR image of at most SLOT_SIZE x SLOT_SIZE.
+        :param timeout: Maximum seconds to wait with the block policy.
+        :return: True if the frame was written.
+        """
+        h, w = img.shape[:2]
+        if h > SLOT_SIZE or w > SLOT_SIZE:
+            raise ValueError(f"[ERROR] Frame {name} of {w}x{h} does not fit a {SLOT_SIZE}x{SLOT_SIZE} slot")
+        encoded = name.encode()[:NAME_BYTES]
+
+        with self._producer_lock:
+            header = self.header
+            header[OFFERED] += 1
+            head = int(header[HEAD])
+
+            if self.policy == "block":
+                deadline = time.monotonic() + timeout
+                delay = 0.001
+                while head - header[TAIL] >= self.slots:
+                    if time.monotonic() >= deadline:
+                        header[DROPPED_NEWEST] += 1
+                        return False
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            elif self.policy == "downsample":
+                if head - header[TAIL] >= HIGH_WATER * self.slots and header[OFFERED] % DECIMATION != 0:
+                    header[DECIMATED] += 1
+                    return False
+
+            slot = head % self.slots
+            meta = self.meta[slot]
+            meta[SEQ] += 1 # Odd: being written
+            self.frames[slot, :h, :w] = img
+            self.names[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            meta[INDEX] = head
+            meta[HEIGHT] = h
+            meta[WIDTH] = w
+            meta[NAME_LEN] = len(encoded)
+            meta[SEQ] += 1 # Even: stable
+            header[HEAD] = head + 1
+        return True
+
+    # ---------------------------------- consumer side ----------------------------------
+
+    def get(self, timeout=None):
+        """
+        Reads the oldest frame of the ring.
+
+        :param timeout: Maximum seconds to wait for a frame, None to wait forever.
+        :return: (name, image copy), or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.001
+        header = self.header
+        while True:
+            tail = int(header[TAIL])
+            head = int(header[HEAD])
+            if head == tail:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+                continue
+            delay = 0.001
+
+            if head - tail > self.slots: # The producer lapped us, the oldest frames are gone
+                header[DROPPED_OLDEST] += head - self.slots - tail
+                header[TAIL] = head - self.slots
+                continue
+
+            slot = tail % self.slots
+            meta = self.meta[slot]
+            seq = int(meta[SEQ])
+            if seq % 2 == 1 or meta[INDEX] != tail:
+                if meta[INDEX] > tail: # Overwritten by a newer frame
+                    header[DROPPED_OLDEST] += 1
+                    header[TAIL] = tail + 1
+                else: # Being written, yield to the producer instead of spinning on the slot
+                    time.sleep(0)
+                continue
+            h, w, name_len = int(meta[HEIGHT]), int(meta[WIDTH]), int(meta[NAME_LEN])
+            img = self.frames[slot, :h, :w].copy()
+            name = self.names[slot, :name_len].tobytes().decode(errors="replace")
+            if int(meta[SEQ]) != seq: # Overwritten while copying
+                continue
+
+            header[TAIL] = tail + 1
+            header[CONSUMED] += 1
+            return name, img
+
+    def close(self):
+        """
+        Detaches from the shared memory block.
+        """
+        self.header = self.meta = self.names = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory block (creator only).
+        """
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -1,15 +1,23 @@
 import cv2 as cv
 import numpy as np
-import requests
 import time
-from utility import get_observation, set_mode, wait, simulation, protect_battery, safe, take_photo
+import melvin_client
+from utility import get_observation, simulation
+from canvas_store import open_canvas
+from png_stream import png_chunks
+from photo_pipeline import resize_plan
+from toroidal_paste import paste
 
 MELVIN_BASE_URL = "http://10.100.10.14:33000"
 
 DEBUG = False
 
 # Create a blank canvas with the dimensions you need
-def create_canvas():
+def create_canvas(path=None):
+    # Reuse the on-disk canvas shared with the stitching process if a path is given
+    if path is not None:
+        return open_canvas(path, 'r+')
+
     # Create a blank 21600x10800 canvas (initialized as black)
     canvas = np.zeros((10800, 21600, 3), dtype=np.uint8)
     
@@ -25,7 +33,7 @@ def capture_and_stitch(canvas):
     time.sleep(0.5)
     save = get_observation()
 
-    response = requests.get(f"{MELVIN_BASE_URL}/image")
+    response = melvin_client.get("/image")
     response.raise_for_status()
     
     lens_size = {'wide': 1000, 'normal': 800, 'narrow': 600}
@@ -43,41 +51,23 @@ def capture_and_stitch(canvas):
     img = cv.imdecode(np.frombuffer(image_data, np.uint8), cv.IMREAD_COLOR)
     
     current_lens_size = lens_size[current_lens]
-    img = cv.resize(img, (current_lens_size, current_lens_size))
+    plan = resize_plan(current_lens_size)
 
     # Get image dimensions
-    h, w = img.shape[:2]
+    h = w = current_lens_size
     
     # Calculate where to place this image on the canvas
     # You might need to adjust these calculations based on your coordinate system
     canvas_x = width_x
     canvas_y = height_y 
     
-    # Make sure the position is valid on our canvas
     if canvas_x < 0 or canvas_y < 0 or canvas_x + w > 21600 or canvas_y + h > 10800:
-        # Handle edge cases by clipping to canvas boundaries
-        # Calculate valid portion of the image and valid position on canvas
-        start_x = max(0, -canvas_x)
-        start_y = max(0, -canvas_y)
-        end_x = min(w, 21600 - canvas_x)
-        end_y = min(h, 10800 - canvas_y)
-        
-        # Adjust canvas position to be within bounds
-        valid_canvas_x = max(0, canvas_x)
-        valid_canvas_y = max(0, canvas_y)
-        
-        # Extract valid portion of image
-        valid_img = img[start_y:end_y, start_x:end_x]
-        
-        # Calculate valid dimensions
-        valid_h, valid_w = valid_img.shape[:2]
-        
-        # Place the valid portion onto the canvas
-        canvas[valid_canvas_y:valid_canvas_y+valid_h, valid_canvas_x:valid_canvas_x+valid_w] = valid_img
-        
+        # Crossing an edge of the map: the part outside comes back on the other side
+        img = plan.resize(img)
+        paste(canvas, img, canvas_x, canvas_y)
     else:
-        # Normal case - place the entire image
-        canvas[canvas_y:canvas_y+h, canvas_x:canvas_x+w] = img
+        # Normal case - resize straight into the canvas, no intermediate image (the returned image is a view)
+        img = plan.resize(img, canvas[canvas_y:canvas_y+h, canvas_x:canvas_x+w])
         
     
     return img
@@ -86,9 +76,12 @@ def capture_and_stitch(canvas):
 def get_canvas_bytes(canvas, format='.png', quality=90):
     """
     Convert the entire stitched canvas to bytes.
+    PNG is encoded block by block (see png_stream), without a second full size copy of the map.
     
     :param canvas: the 21600x10800 canvas
     """
+    if format == '.png':
+        return b"".join(png_chunks(canvas))
     success, buffer = cv.imencode(format, canvas, [cv.IMWRITE_JPEG_QUALITY, quality])
     if success:
         return buffer.tobytes()
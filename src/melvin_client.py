@@ -0,0 +1,144 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DEBUG = False
+
+MELVIN_BASE_URL = "http://10.100.10.14:33000"
+HEADERS = {"User-Agent": "curl/7.68.0", "Content-Type": "application/json"}
+
+POOL_SIZE = 8 # Persistent connections kept open to melvin
+CONNECT_TIMEOUT = 3 # Seconds to open a connection through the tunnel
+# Read timeout in seconds per endpoint, None waits forever (streams)
+READ_TIMEOUTS = {
+    "/observation": 5,
+    "/control": 5,
+    "/simulation": 5,
+    "/slots": 5,
+    "/objective": 10,
+    "/image": 20,
+    "/beacon": 20,
+    "/dailyMap": 300,
+    "/announcements": None,
+}
+DEFAULT_READ_TIMEOUT = 10
+MAX_RETRIES = 3 # Extra attempts after a failed one, only for requests that are safe to repeat
+BACKOFF = 0.25 # Base delay in seconds, doubled at each retry and jittered
+# Submissions must never be sent twice, whatever the method
+NO_RETRY = {("POST", "/image"), ("POST", "/dailyMap"), ("PUT", "/beacon")}
+# Base of the errors raised by request(), so that callers can catch them without importing requests
+RequestException = requests.exceptions.RequestException
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the pooled session of this process (a new one after a fork, sockets cannot be shared).
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def _endpoint(path):
+    """
+    Normalizes a path or a full melvin URL to its endpoint, e.g. "/image".
+    """
+    if path.startswith(MELVIN_BASE_URL):
+        path = path[len(MELVIN_BASE_URL):]
+    return "/" + path.strip("/").split("/")[0].split("?")[0]
+
+
+def _record(endpoint, seconds, failed):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        stats["count"] += 1
+        stats["errors"] += failed
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["last"] = seconds
+
+
+def latency_stats():
+    """
+    Returns the latency statistics per endpoint: count, errors, mean, max and last duration in seconds.
+    """
+    with _stats_lock:
+        return {endpoint: dict(stats, mean=stats["total"] / stats["count"]) for endpoint, stats in _stats.items()}
+
+
+def request(method, path, retries=None, **kwargs):
+    """
+    Sends a request to melvin through the pooled session.
+    Connection errors, timeouts and 5xx answers are retried with jittered exponential backoff,
+    except for submissions (NO_RETRY) and streams. The caller checks the status as with requests.
+
+    :param method: HTTP method.
+    :param path: Endpoint path (e.g. "/observation") or full URL on melvin.
+    :param retries: Overrides MAX_RETRIES.
+    :param kwargs: Passed to requests (params, json, files, headers, stream...).
+    :return: The requests.Response.
+    """
+    method = method.upper()
+    endpoint = _endpoint(path)
+    url = path if path.startswith("http") else MELVIN_BASE_URL + path
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUTS.get(endpoint, DEFAULT_READ_TIMEOUT)))
+    if retries is None:
+        retries = 0 if (method, endpoint) in NO_RETRY or kwargs.get("stream") else MAX_RETRIES
+
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record(endpoint, time.monotonic() - start, True)
+            if attempt >= retries:
+                raise
+            if DEBUG:
+                print(f"[CLIENT] {method} {endpoint} failed ({e}), retrying")
+        else:
+            failed = response.status_code >= 500
+            _record(endpoint, time.monotonic() - start, failed)
+            if not failed or attempt >= retries:
+                return response
+            if DEBUG:
+                print(f"[CLIENT] {method} {endpoint} answered {response.status_code}, retrying")
+        time.sleep(BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+        attempt += 1
+
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+
+def put(path, **kwargs):
+    return request("PUT", path, **kwargs)
+
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+
+if __name__ == '__main__':
+    for _ in range(5):
+        try:
+            get("/observation").raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"[ERROR] {e}")
+    print(latency_stats())
@@ -0,0 +1,105 @@
+import threading
+import time
+
+DEBUG = False
+
+REISSUE_TIMEOUT = 10 # Seconds without any sign of the requested transition before the command is sent again
+TRANSITION_STATE = "transition" # State reported by melvin while switching modes
+
+
+class ModeTransitionManager:
+    '''
+    Tracks the mode changes requested to melvin on top of the shared telemetry snapshot.
+
+    A mode change is sent once. The manager then follows the observations: while melvin reports the requested
+    state or "transition" nothing is sent again, and the command is re-issued only if neither shows up within
+    REISSUE_TIMEOUT seconds. Waiters block in await_mode, and callbacks fire from the telemetry updates.
+    '''
+    def __init__(self, telemetry, send_mode, reissue_timeout=REISSUE_TIMEOUT):
+        """
+        :param telemetry: TelemetryCache providing the observations.
+        :param send_mode: Callable (state, vx, vy, angle) sending the PUT /control request.
+        :param reissue_timeout: Seconds before a command without effect is sent again.
+        """
+        self.telemetry = telemetry
+        self.send_mode = send_mode
+        self.reissue_timeout = reissue_timeout
+        self.requested = None # Last requested state
+        self.requested_at = 0 # time.monotonic() of the last command sent
+        self._callbacks = [] # (state, deadline, on_reached, on_timeout)
+        self._lock = threading.Lock()
+        telemetry.subscribe(self._on_observation)
+
+    def sent(self, state):
+        """
+        Records a mode change that has just been sent to melvin.
+        """
+        with self._lock:
+            self.requested = state
+            self.requested_at = time.monotonic()
+
+    def request(self, state, vx, vy, angle, on_reached=None, on_timeout=None, deadline=None):
+        """
+        Sends a mode change once and optionally registers callbacks.
+
+        :param state: Requested state (acquisition, charge, communication...).
+        :param vx: Velocity in x-direction to keep.
+        :param vy: Velocity in y-direction to keep.
+        :param angle: Camera angle to keep.
+        :param on_reached: Called with the observation once melvin reports the state.
+        :param on_timeout: Called with the last observation if the deadline passes first.
+        :param deadline: time.monotonic() value, None for no deadline.
+        """
+        self.send_mode(state, vx, vy, angle)
+        self.sent(state)
+        if on_reached is not None or on_timeout is not None:
+            with self._lock:
+                self._callbacks.append((state, deadline, on_reached, on_timeout))
+
+    def _on_observation(self, observation):
+        now = time.monotonic()
+        fired = []
+        with self._lock:
+            if observation["state"] == self.requested:
+                self.requested = None # Reached, a later wait for it must send it again
+            remaining = []
+            for state, deadline, on_reached, on_timeout in self._callbacks:
+                if observation["state"] == state:
+                    fired.append((on_reached, observation))
+                elif deadline is not None and now > deadline:
+                    fired.append((on_timeout, observation))
+                else:
+                    remaining.append((state, deadline, on_reached, on_timeout))
+            self._callbacks = remaining
+        for callback, observation in fired:
+            if callback is not None:
+                callback(observation)
+
+    def await_mode(self, state, deadline=None):
+        """
+        Blocks until melvin reports the given state, enters safe mode or the deadline passes.
+        The mode change is sent if it has not been requested yet, and re-sent only if it shows no effect
+        for reissue_timeout seconds.
+
+        :param state: Expected state.
+        :param deadline: time.monotonic() value, None to wait forever.
+        :return: The last observation.
+        """
+        observation, received = self.telemetry.latest()
+        if observation["state"] != state and self.requested != state:
+            self.request(state, observation["vx"], observation["vy"], observation["angle"])
+
+        while True:
+            if observation["state"] == state or observation["state"] == "safe":
+                return observation
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return observation
+            if observation["state"] != TRANSITION_STATE and now - self.requested_at >= self.reissue_timeout:
+                if DEBUG:
+                    print(f"[MODE] No sign of {state} after {self.reissue_timeout} s, sending it again")
+                self.request(state, observation["vx"], observation["vy"], observation["angle"])
+            timeout = None if deadline is None else deadline - now
+            newer, newer_received = self.telemetry.wait_newer(received, timeout)
+            if newer is not None:
+                observation, received = newer, newer_received
@@ -1,4 +1,4 @@
-import requests
+import melvin_client
 from datetime import datetime, timezone, timedelta
 
 DEBUG = False
@@ -17,7 +17,7 @@ def get_and_sort_objectives(contain_secret=True):
     HEADERS = {"Content-Type": "application/json"}
 
     try:
-        response = requests.get(BASE_URL, headers=HEADERS)
+        response = melvin_client.get(BASE_URL, headers=HEADERS)
         response.raise_for_status()
         objectives = response.json()
 
@@ -45,7 +45,7 @@ def get_and_sort_objectives(contain_secret=True):
             )
         return sorted_objectives
 
-    except requests.exceptions.RequestException as e:
+    except melvin_client.RequestException as e:
         if DEBUG:
             print(f"Error during API request: {e}")
     except KeyError as e:
@@ -60,7 +60,7 @@ def get_current_objectives(contain_secret=True):
     HEADERS = {"Content-Type": "application/json"}
 
     try:
-        response = requests.get(BASE_URL, headers=HEADERS)
+        response = melvin_client.get(BASE_URL, headers=HEADERS)
         response.raise_for_status()
         objectives = response.json()
 
@@ -92,7 +92,7 @@ def get_current_objectives(contain_secret=True):
         
         return sorted_zoned_objectives
 
-    except requests.exceptions.RequestException as e:
+    except melvin_client.RequestException as e:
         if DEBUG:
             print(f"Error during API request: {e}")
     except KeyError as e:
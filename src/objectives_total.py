@@ -1,6 +1,5 @@
-import requests
-import sys
-from datetime import datetime, timezone, timedelta
+import melvin_client
+from datetime import datetime, timezone
 
 DEBUG = True
 
@@ -19,7 +18,7 @@ def sort_objectives():
     HEADERS = {"Content-Type": "application/json"}
 
     try:
-        response = requests.get(BASE_URL, headers=HEADERS)
+        response = melvin_client.get(BASE_URL, headers=HEADERS)
         response.raise_for_status()
 
         objectives = response.json()
@@ -36,7 +35,7 @@ def sort_objectives():
         #    print("Sorted Objectives by Starting Time")
         return sorted_objectives_images, sorted_objectives_beacon
 
-    except requests.exceptions.RequestException as e:
+    except melvin_client.RequestException as e:
         if DEBUG:
             print(f"Error during API request: {e}")
     except KeyError as e:
@@ -1,15 +1,27 @@
-from utility import get_observation, set_mode, wait, simulation, protect_battery, safe, take_photo, check_for_next_slot
+from utility import get_observation, set_mode, wait, simulation, protect_battery, safe, await_velocity, check_for_next_slot, TELEMETRY, capture_photo
 from submit_responses import submit_EB, submit_image
 from beacon_position_calculator import find_solution
+from beacon_localizer import GridLocalizer
+from ping_store import PingStore
 from objectives import get_current_objectives, parse_datetime
 from objectives_total import sort_objectives
 from vel_calculation import calculate_velocity
 from compute_time import time_computation
 from zonedStitching import stitch_zoned
+from coverage_grid import CoverageGrid
+from rendezvous import calculate_travel_time, smallest_tolerance
+from trajectory import ground_track
+from target_planner import plan_targets
+from runtime import RUNTIME, interruptible_sleep
+from photo_pipeline import decode_photo, footprint_size, resize_plan
+from frame_ring import FrameRing
+from stitch_engine import StitchEngine
+from quality_layer import open_quality, quality_file, photo_quality, GOOD_QUALITY
+from toroidal_paste import paste
+from canvas_store import TiledCanvas, open_canvas, export_requested, CANVAS_FILE, FLUSH_INTERVAL
+import melvin_client
 from collections import defaultdict
 
-import zlib
-import struct
 import traceback
 import sys
 import multiprocessing
@@ -25,7 +37,6 @@ import random
 import math
 import subprocess
 from datetime import datetime, timezone, timedelta
-from bitarray import bitarray
 
 
 DEBUG = False
@@ -44,7 +55,7 @@ def handler_exception(exc_type, exc_value, exc_traceback):
     '''
     This function handles any exceptions that may occur during excecution.
     It first sets MELVIN to "charge" mode and saves the exception and the corresponding timestamp to a file and then books the next available
-    slot, so that the operator can connect and fix the issue. Finally, it backs up the BitMatrix object
+    slot, so that the operator can connect and fix the issue. Finally, it backs up the coverage map (Map)
     and it runs the program "safety_handler.py", which is a backup safety program that only captures the
     map.
     '''
@@ -131,40 +142,55 @@ objective_queue = queue.Queue()
 
 objective_available = threading.Event()
 
+seen_objectives = set()
+objectives_task = None
+
 def objective_monitor():
     """
-    Thread that monitors for new known location objectives via API calls. Every 5 seconds, it adds any new objectives detected to the objective_queue.
+    Checks for new known location objectives via an API call and adds them to the objective_queue.
+    Runs every 5 seconds as a task of the runtime, and wakes up the commander when something new shows up.
     """
-    
-    if DEBUG:
-        print("[OBJECTIVES] Started monitoring.")
-    already_seen = set()
-    while True:
-        curr_objectives = get_current_objectives(contain_secret=False)
-        flag = False
-        for obj in curr_objectives:
+    curr_objectives = get_current_objectives(contain_secret=False)
+    flag = False
+    for obj in curr_objectives or []:
+        if DEBUG:
+            print(f"[OBJECTIVES] Looking at objective with id {obj['id']}")
+        if obj['id'] not in seen_objectives:
+            seen_objectives.add(obj['id'])
+            objective_queue.put(obj)
             if DEBUG:
-                print(f"[OBJECTIVES] Looking at objective with id {obj['id']}")
-            if obj['id'] not in already_seen:
-                already_seen.add(obj['id'])
-                objective_queue.put(obj)
-                if DEBUG:
-                    print("[OBJECTIVES] Added a new objective.")
-                flag = True
+                print("[OBJECTIVES] Added a new objective.")
+            flag = True
 
-        if flag:
-            objective_available.set()
-            if DEBUG:
-                print("[OBJECTIVES] New objectives detected!")
-    
-        time.sleep(5)
+    if flag:
+        objective_available.set()
+        RUNTIME.notify()
+        if DEBUG:
+            print("[OBJECTIVES] New objectives detected!")
 
 def start_objectives_monitoring():
     """
-    Starts the objective monitoring thread.
+    Starts the objective monitoring task on the runtime (only once).
     """
-    monitor_thread = threading.Thread(target=objective_monitor, daemon=True)
-    monitor_thread.start()
+    global objectives_task
+    if objectives_task is not None:
+        return
+    if DEBUG:
+        print("[OBJECTIVES] Started monitoring.")
+    objectives_task = RUNTIME.every(5, objective_monitor)
+
+def interrupt_pending():
+    """
+    True when a beacon or a known location objective is waiting for the commander.
+    """
+    return beacon_active.is_set() or objective_available.is_set()
+
+def start_runtime():
+    """
+    Starts the asyncio runtime and moves the telemetry polling onto it.
+    """
+    RUNTIME.start()
+    TELEMETRY.attach(RUNTIME)
 
 def objective_check_routine(image_queue):
     """
@@ -372,34 +398,18 @@ def objective_check_routine(image_queue):
                     cur_vy = check["vy"]
 
                     vel_data = calculate_velocity(cur_x, cur_y, des_x, des_y, cur_vx, cur_vy)
-                    current_velocity = get_observation()
 
                     safe()
                     if DEBUG:
-                        print(f"Current velx: {current_velocity['vx']}, current vely: {current_velocity['vy']} | Desired velx: {vel_data['vx']}, desired vely: {vel_data['vy']}", flush=True)
-                    if ((current_velocity["vx"] == vel_data["vx"]) and (current_velocity["vy"] == vel_data["vy"])):
+                        print(f"Current velx: {cur_vx}, current vely: {cur_vy} | Desired velx: {vel_data['vx']}, desired vely: {vel_data['vy']}", flush=True)
+                    if ((cur_vx == vel_data["vx"]) and (cur_vy == vel_data["vy"])):
                         break
 
                     # Time passes, set mode to 'acquisition' and begin orbiting towards the target point
-                    for _ in range(5):
-                        protect_battery(6, desired_angle)
-                        safe()
-                        set_mode("acquisition", vel_data["vx"], vel_data["vy"], desired_angle) # Apply the computed velocity
-                        wait("acquisition")
-                        time.sleep(0.1)
-                        if DEBUG:
-                            print(f"[CO-PILOT OF OBJECTIVE] SET {desired_angle} angle")
-                    
-                        #name = take_photo()
-                        # parts = name.split('_')
-                        # x = int(parts[1])
-                        # y = int(parts[2][:-4])
-
-                        if DEBUG:
-                            simulation(False, 1)
-                        #Map.update_map(x, y, desired_angle, 1)
-                        if DEBUG:
-                            simulation(False, 20)
+                    # The computed velocity is sent once and followed on the telemetry until melvin reports it
+                    await_velocity(vel_data["vx"], vel_data["vy"], desired_angle, 6)
+                    if DEBUG:
+                        print(f"[CO-PILOT OF OBJECTIVE] SET {desired_angle} angle")
                         
                 if DEBUG:
                     simulation(False,20)
@@ -450,11 +460,8 @@ def objective_check_routine(image_queue):
                         
                         check = get_observation()
 
-                        threshold = 20
-                        time1 = float('inf')
-                        while math.isinf(time1) and threshold <= 100:
-                            time1 = calculate_travel_time(check["width_x"],check["height_y"],check["vx"],check["vy"],des_x,des_y,21600,10800,threshold)
-                            threshold += 5
+                        # Smallest tolerance out of 20, 25, ..., 100 that reaches the destination, in one query
+                        threshold, time1 = smallest_tolerance(check["width_x"],check["height_y"],check["vx"],check["vy"],des_x,des_y)
 
                         if DEBUG:
                             print(f"[CO-PILOT OF OBJECTIVE] Just got sleep order time estimate in REAL time: {round(time1, 1)} and i am in simulation 1", flush=True)
@@ -504,9 +511,10 @@ def objective_check_routine(image_queue):
                 if DEBUG:
                     simulation(False, 1)
 
+                # The mode was sent once above, from here on every check is on a newer observation
+                check, received = TELEMETRY.wait_newer(time.monotonic())
                 while True:
                     protect_battery(3, desired_angle)
-                    check = get_observation()
                     safe()
 
                     if DEBUG:
@@ -518,13 +526,11 @@ def objective_check_routine(image_queue):
                     elif des_x < check['width_x'] and des_y < check['height_y']:
                         break
 
-                    
-                    set_mode("acquisition", check["vx"], check["vy"], desired_angle)
-                    wait("acquisition")
+                    check, received = TELEMETRY.wait_newer(received)
                     
 
                 while True:
-                    check = get_observation()
+                    check, received = TELEMETRY.wait_newer(received)
                     if (check["width_x"] >= current_obj["zone"][0] and check["height_y"] >= current_obj["zone"][1]):
                         protect_battery(4.9, desired_angle) # Check battery levels
                         safe()
@@ -566,25 +572,20 @@ def objective_check_routine(image_queue):
 # ------------------------------------ AUTOMATIC IMAGE STITCHING ---------------------------------
 
 canvas = None
+canvas_store = None
+quality = None # Quality layer of the canvas, a pixel is only overwritten by a better one
 
-def get_canvas_bytes(canvas, format='.png', quality=90):
-    """
-    Convert the entire stitched canvas to bytes.
-    
-    :param canvas: the canvas on which the image are being stitched
-    :param format: format of the canvas
-    :param quality: quality of encoding
-    """
-    success, buffer = cv2.imencode(format, canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
-    if success:
-        return buffer.tobytes()
-    return None
+RING_POLICY = "drop_oldest" # What the image ring does when the stitcher falls behind: block (stalls flight control), drop_oldest or downsample
+STITCH_WORKERS = 4 # Band worker processes pasting onto the canvas, 0 to paste inside the stitching process
+stitch_engine = None
 
-def stitch_image(name):
+def stitch_image(name, data=None, img=None):
     """
     Stitch an image onto the global canvas.
     
     :param name: The name of the image in the following format: lens{precision}_{x}_{y}.jpg 
+    :param data: The encoded bytes of the image, if None the image is read from disk
+    :param img: The image already decoded and resized (e.g. from the image ring)
     """
 
     global canvas
@@ -606,59 +607,73 @@ def stitch_image(name):
 
     canvas_x, canvas_y = get_coords(name)
 
-    img = cv2.imread(name)
-    img = cv2.resize(img, (lens, lens))
+    # Resized into the pooled buffer of the lens, consumed by the paste below (the engine queues its own copy)
+    out = resize_plan(lens).buffer() if stitch_engine is None else None
+    if img is None and data is not None:
+        img = decode_photo(data, lens, out) # Decoded once, straight from memory
+    elif img is None:
+        img = resize_plan(lens).resize(cv2.imread(name), out)
 
     h, w = img.shape[:2]
 
-    # Make sure the position is valid on our canvas
-    if canvas_x < 0 or canvas_y < 0 or canvas_x + w > 21600 or canvas_y + h > 10800:
-        # Handle edge cases by clipping to canvas boundaries
-        # Calculate valid portion of the image and valid position on canvas
-        start_x = max(0, -canvas_x)
-        start_y = max(0, -canvas_y)
-        end_x = min(w, 21600 - canvas_x)
-        end_y = min(h, 10800 - canvas_y)
-        
-        # Adjust canvas position to be within bounds
-        valid_canvas_x = max(0, canvas_x)
-        valid_canvas_y = max(0, canvas_y)
-        
-        # Extract valid portion of image
-        valid_img = img[start_y:end_y, start_x:end_x]
-        
-        # Calculate valid dimensions
-        valid_h, valid_w = valid_img.shape[:2]
-        
-        # Place the valid portion onto the canvas
-        canvas[valid_canvas_y:valid_canvas_y+valid_h, valid_canvas_x:valid_canvas_x+valid_w] = valid_img
-        
-    else:
-        # Place the whole image
-        canvas[canvas_y:canvas_y+h, canvas_x:canvas_x+w] = img
+    if stitch_engine is not None:
+        # Pasted by the band workers, wrapping around the map
+        for rect in stitch_engine.submit(img, canvas_x, canvas_y):
+            canvas_store.mark_dirty(*rect)
+        return
+
+    # Wrapping around the map, only where it is better than what is there
+    for rect in paste(canvas, img, canvas_x, canvas_y, quality=quality, img_quality=photo_quality(h, w)):
+        canvas_store.mark_dirty(*rect)
     
     # return canvas
 
-def stitch_worker(image_queue):
+def stitch_worker(image_queue, engine=None):
     """
     The function that will be run by the stitching subprocess.
+    Only the tiles touched by each image are saved, on a debounce timer. The full map PNG is written only
+    when the operator asks for it (see canvas_store.export_requested), the daily map submission streams from the
+    canvas itself (submit_responses.submit_map_from_canvas).
     
-    :param image_queue: the queue that contains the images waiting to be stitched 
+    :param image_queue: the FrameRing that contains the images waiting to be stitched 
+    :param engine: the StitchEngine pasting the images in parallel, None to paste them here
     """
-    global canvas
-    canvas = np.zeros((10800, 21600, 3), dtype=np.uint8)
+    global canvas, canvas_store, quality, stitch_engine
+    canvas_store = TiledCanvas() # Reopens the on-disk canvas, so a restart keeps everything stitched so far
+    canvas_store.load()
+    canvas = canvas_store.canvas
+    quality = open_quality(quality_file(CANVAS_FILE), 'r+')
+    stitch_engine = engine
+
+    def settle():
+        # The band workers write the same file, wait for them before anything reads the canvas back
+        if stitch_engine is not None:
+            stitch_engine.join()
 
     try:
         # Continuously listens for images and stitches them onto the canvas.
         while True:
             if DEBUG:
                 print("[IMAGES] Waiting for image in queue...")
-            name = image_queue.get()  # Wait for an image
-            stitch_image(name)  # Stitch image onto canvas
-            
-            stitched_map_bytes = get_canvas_bytes(canvas)
-            with open("debug_stitched_map.png", "wb") as f:
-                f.write(stitched_map_bytes)
+            frame = image_queue.get(timeout=FLUSH_INTERVAL)  # Wait for an image
+
+            if frame is not None:
+                name, img = frame
+                stitch_image(name, img=img)  # Stitch image onto canvas
+                if canvas_store.dirty and time.monotonic() - canvas_store.last_flush >= FLUSH_INTERVAL:
+                    settle()
+                canvas_store.flush()
+            else:
+                settle()
+                canvas_store.flush(force=True) # Ring is idle, save everything pending
+                quality.flush()
+
+            if export_requested():
+                settle()
+                canvas_store.save_png(stitched_map_path)
+                if DEBUG:
+                    print("[IMAGES] Full map exported.")
+                continue
 
             if DEBUG:
                 print("[IMAGES] Image stitched and canvas updated.")
@@ -673,21 +688,36 @@ def start_stitching_process():
     """
     Starts the stitching process.
     """
-    image_queue = multiprocessing.Queue()
-    process = multiprocessing.Process(target=stitch_worker, args=(image_queue,), daemon=True)
+    image_queue = FrameRing(policy=RING_POLICY) # Shared memory ring of decoded images
+    # Started from here: the stitching process is a daemon and cannot have children of its own
+    engine = StitchEngine(CANVAS_FILE, STITCH_WORKERS) if STITCH_WORKERS > 0 else None
+    process = multiprocessing.Process(target=stitch_worker, args=(image_queue, engine), daemon=True)
     process.start()
     return image_queue
 
 
 
+def read_stitched_canvas():
+    """
+    Opens the map being stitched by the stitching process, read-only and without copying it.
+    """
+    return open_canvas(CANVAS_FILE, 'r')
+
+
 def take_and_enqueue_photo(queue):
-    filename = take_photo()
-    if queue.qsize() < 40: # threshold to not overload memory
-        queue.put(filename)
+    filename, image_data = capture_photo()
+    size = footprint_size(filename)
+    # Decoded once into the pooled buffer of the lens, put() copies it into the ring
+    img = decode_photo(image_data, size, resize_plan(size).buffer() if size else None)
+    if img is None:
         if DEBUG:
-            print(f"[IMAGES] Image {filename} taken and enqueued. Queue size now {queue.qsize()}")
+            print(f"[IMAGES] Image {filename} could not be decoded.")
+        return filename
+    if queue.put(filename, img): # The ring policy handles a stitcher that falls behind
+        if DEBUG:
+            print(f"[IMAGES] Image {filename} taken and enqueued. Ring {queue.counters()}")
     elif DEBUG:
-        print(f"[IMAGES] Image {filename} taken. Queue FULL.")
+        print(f"[IMAGES] Image {filename} taken. Ring FULL {queue.counters()}")
     return filename
 
 
@@ -729,9 +759,11 @@ NOISE_RANGE = [-1, 1]
 
 ANNOUNCEMENTS_URL = f"{MELVIN_BASE_URL}/announcements"
 
-PING_THRESHOLD = 8 # Number of pings to make the estimation of EB position (calling find_solution())
+PING_THRESHOLD = 8 # Number of pings to make the estimation of EB position (calling find_solution()) at the latest
+EARLY_SUBMIT_MASS = None # Submit before PING_THRESHOLD once the best guess hits with this probability, None until calibrated on flight data
+MIN_GUESS_MASS = 0.2 # After a miss, the next guess is submitted right away if it adds at least this hit probability
 
-PING_LOG_FILE_PATH = "ping_log.txt"
+PINGS = PingStore() # Pings of the beacons, replayed from "ping_log.jsonl" after a restart
 
 beacon_active = threading.Event()
 announcement_stream = None
@@ -746,12 +778,16 @@ d_noisy = {}
 pings = {}
 headers = {"Accept": "text/event-stream"}
 
+announcement_task = None
+
 def start_announcement_thread():
     """
-    Starts the thread that contiunuously listens to announcements
+    Starts the task that contiunuously listens to announcements (only once)
     """
-    announcement_thread = threading.Thread(target=listen_to_announcements, daemon=True)
-    announcement_thread.start()
+    global announcement_task
+    if announcement_task is not None:
+        return
+    announcement_task = RUNTIME.spawn_blocking(listen_to_announcements)
 
 def estimated_beacon_position(dnoisy):
     """
@@ -761,6 +797,21 @@ def estimated_beacon_position(dnoisy):
     d_actual = round(dnoisy - k * (3 * ALLOWED_DELTA + 0.4 * (dnoisy + 1)) / 4)
     return d_actual
 
+def beacon_guesses(beacon, count):
+    """
+    Picks the guesses of a beacon position most likely to be accepted one after the other, from the posterior
+    of all its pings (see beacon_localizer.GridLocalizer.modes).
+
+    :param beacon: ID of the beacon.
+    :param count: Number of guesses left.
+    :return: List of ((x, y), probability to hit while the previous guesses missed), best first.
+    """
+    localizer = GridLocalizer()
+    for ping in PINGS.pings(beacon):
+        if ping["noisy"] is not None:
+            localizer.add(ping["x"], ping["y"], ping["noisy"])
+    return localizer.modes(count, ALLOWED_DELTA)
+
 def listen_to_announcements():
     """
     Continuously listens to /announcements. It detects messages associated with beacons and updates the global flag accordingly.
@@ -774,7 +825,7 @@ def listen_to_announcements():
         if DEBUG:
             print("[BEACON] Subscribing to /announcements (SSE) for real-time updates...")
 
-        announcement_stream = requests.get(ANNOUNCEMENTS_URL, stream=True, headers=headers)
+        announcement_stream = melvin_client.get(ANNOUNCEMENTS_URL, stream=True, headers=headers)
         announcement_stream.raise_for_status()
 
         if announcement_stream is None:
@@ -816,6 +867,7 @@ def listen_to_announcements():
                         past_ids.add(id)
                         pings[id] = 0
                         beacon_active.set()
+                        RUNTIME.notify()
 
                         if DEBUG:
                             print(f"[BEACON] GOT STARTING MESSAGE FOR EB, ID: {id}")
@@ -843,9 +895,11 @@ def listen_to_announcements():
                                 print("y_ping_melvin")
                                 print(crucial_check['height_y'])
 
-                            # Stores all necessary EB information in a file
-                            store_ping(crucial_check['width_x'], crucial_check['height_y'], estimated_beacon_position(d_noisy[ping_num[id]]), beacon_id)
+                            # Stores all necessary EB information (in memory and in the ping log)
+                            PINGS.add(beacon_id, crucial_check['width_x'], crucial_check['height_y'],
+                                      estimated_beacon_position(d_noisy[ping_num[id]]), d_noisy[ping_num[id]])
                             ping_num[id] += 1 # Increase the number of pings that we have taken
+                            RUNTIME.notify()
                         
                     
                     elif DEBUG:
@@ -856,47 +910,18 @@ def listen_to_announcements():
             print(f"[BEACON ERROR] Failed to track announcements: {str(e)}")
         raise
 
-def store_ping(melvin_x, melvin_y, actual_distance, beacon_identifier):
-    """
-    Stores MELVIN's location and received distance from beacon, avoiding duplicates.
-    """
-    global pings  # Ensure we modify the global dictionary
-
-    # If beacon_id is not in the dictionary, initialize a new list
-    if beacon_identifier not in pings:
-        pings[beacon_identifier] = []
-
-    if not os.path.exists(PING_LOG_FILE_PATH):
-        try:
-            with open(PING_LOG_FILE_PATH, "w") as file:
-                file.write("")
-            if DEBUG:
-                print(f"[BEACON] Created log file: {PING_LOG_FILE_PATH}")
-        except PermissionError:
-            if DEBUG:
-                print("[BEACON ERROR] Permission denied! Unable to create log file in root directory.")
-            raise
-    with open(PING_LOG_FILE_PATH, "a") as file:
-        file.write(
-            f"[BEACON SUCCESS] PING for Beacon with ID: {beacon_identifier} found at {melvin_x} , {melvin_y}, with actual distance: {actual_distance} - Timestamp: {datetime.now()}\n")
-
-
 def handle_beacon_detection(image_queue):
     """
-    Looks for pings untill PING_THRESHOLD is achieved in order to estimate the location. Between waiting for groups of pings, efficiently changes MELVIN
+    Looks for pings untill PING_THRESHOLD is achieved (or the best guess reaches EARLY_SUBMIT_MASS, if set) in order to estimate the location. Between waiting for groups of pings, efficiently changes MELVIN
     into acquisition mode, to take pictures for the Daily Map. MELVIN goes into charge mode when needed and wakes up in order to take pictures or receive more pings, depending on its position.
     """
     global ping_num 
     global id
     global Map
 
-    def get_last_coordinates(filename):
-        with open(filename, "r") as file:
-            lines = file.readlines()
-        last_line = lines[-1]
-        parts = last_line.split("found at ")[1].split(",") 
-        x, y = int(parts[0].strip()), int(parts[1].split("with")[0].strip()) 
-        return x, y
+    def get_last_coordinates():
+        ping = PINGS.latest(id)
+        return ping["x"], ping["y"]
 
     def get_target(vx, vy, x, y, dist=4000):
         result_x = (x - (math.cos(math.atan(vy/vx)) * dist)) % 21600
@@ -907,6 +932,8 @@ def handle_beacon_detection(image_queue):
     def lcm(a, b):
         return abs(a * b) // math.gcd(a, b)
 
+    early_guess, guessed_pings = None, 0 # Best guess of the pings so far, for EARLY_SUBMIT_MASS
+
     check = get_observation()
     period = lcm(round(21600 / check['vx']), round(10800 / check['vy']))
     if DEBUG:
@@ -931,7 +958,7 @@ def handle_beacon_detection(image_queue):
                     seconds_to_wait = round(seconds_to_wait / 20)
                 starting_ping_num = ping_num[id]
                 for _ in range(seconds_to_wait):
-                    time.sleep(1)
+                    interruptible_sleep(1, lambda: starting_ping_num != ping_num[id])
                     safe("communication")
                     protect_battery(5, "wide", "communication")
                     if starting_ping_num != ping_num[id]:
@@ -958,7 +985,7 @@ def handle_beacon_detection(image_queue):
                             battery_order *= 2
                             sleep_order /= 5
                         
-                        last_x, last_y = get_last_coordinates(PING_LOG_FILE_PATH)
+                        last_x, last_y = get_last_coordinates()
                         check = get_observation()
                         tar_x, tar_y = get_target(check['vx'], check['vy'], last_x, last_y)
                         total_time = calculate_travel_time(check['width_x'], check['height_y'], check['vx'], check['vy'], tar_x, tar_y) - 80
@@ -997,11 +1024,7 @@ def handle_beacon_detection(image_queue):
                                 print("[BEACON CO-PILOT] Thinking about whether I go to sleep or not...!")
                             
                             l = get_trajectory()
-                            save = (-1,-1)
-                            for i in l:
-                                if Map.get_bit(i[0],i[1]) == 0: 
-                                    save = i
-                                    break
+                            save = Map.first_vacant(l)
                             current = get_observation()
                             
                             if DEBUG:
@@ -1029,8 +1052,9 @@ def handle_beacon_detection(image_queue):
                                 
                                 cont = False
                                 for i in range(0,50):
-                                    time.sleep(time_for_sleep_here_only)
-                                    last_x, last_y = get_last_coordinates(PING_LOG_FILE_PATH)
+                                    # A new ping moves the target, so it wakes the check up early
+                                    interruptible_sleep(time_for_sleep_here_only, lambda pings_before=ping_num[id]: ping_num[id] != pings_before)
+                                    last_x, last_y = get_last_coordinates()
                                     check = get_observation()
                                     tar_x, tar_y = get_target(check['vx'], check['vy'], last_x, last_y)
                                     total_time = calculate_travel_time(check['width_x'], check['height_y'], check['vx'], check['vy'], tar_x, tar_y,21600,10800,10) - 80 
@@ -1063,11 +1087,7 @@ def handle_beacon_detection(image_queue):
                                     
                                     l = get_trajectory()
                                     total = len(l)
-                                    vacant = 0
-                                    
-                                    for i in l:
-                                        if Map.get_bit(i[0],i[1]) == 0: 
-                                            vacant+=1
+                                    vacant = Map.count_vacant(l)
                                             
                                     
                                     if DEBUG:
@@ -1082,8 +1102,9 @@ def handle_beacon_detection(image_queue):
                                     time_for_sleep_here_only = round(time_for_sleep_here_only/50,2)
                                     for i in range(0,50):
                                     
-                                        time.sleep(time_for_sleep_here_only)
-                                        last_x, last_y = get_last_coordinates(PING_LOG_FILE_PATH)
+                                        # A new ping moves the target, so it wakes the check up early
+                                        interruptible_sleep(time_for_sleep_here_only, lambda pings_before=ping_num[id]: ping_num[id] != pings_before)
+                                        last_x, last_y = get_last_coordinates()
                                         check = get_observation()
                                         tar_x, tar_y = get_target(check['vx'], check['vy'], last_x, last_y)
                                         total_time = calculate_travel_time(check['width_x'], check['height_y'], check['vx'], check['vy'], tar_x, tar_y,21600,10800,10) - 80
@@ -1122,7 +1143,7 @@ def handle_beacon_detection(image_queue):
                             for i in range(2):
                                 time.sleep(0.2)
                                 safe()
-                                last_x, last_y = get_last_coordinates(PING_LOG_FILE_PATH)
+                                last_x, last_y = get_last_coordinates()
                                 check = get_observation()
                                 tar_x, tar_y = get_target(check['vx'], check['vy'], last_x, last_y)
                                 total_time = calculate_travel_time(check['width_x'], check['height_y'], check['vx'], check['vy'], tar_x, tar_y,21600,10800,10) - 80
@@ -1137,24 +1158,8 @@ def handle_beacon_detection(image_queue):
                                 
                                 current = get_observation()
                                 defender = False
-                                break_com = False
                                 detection_range = 300
-                                for x in range(current["width_x"]-detection_range, current["width_x"]+detection_range):
-                                    for y in range(current["height_y"]-detection_range,current["height_y"]+detection_range):
-                                        if x<0:
-                                            x = 21599 + x
-                                        if y<0:
-                                            y = 10799 + y
-                                        if x>21599:
-                                            x = x - 21599
-                                        if y > 10799:
-                                            y = y - 10799
-                                            
-                                        if Map.get_bit(x,y) == 0:
-                                            break_com = True
-                                            break
-                                    if break_com == True:
-                                        break
+                                break_com = not Map.area_covered(current["width_x"], current["height_y"], detection_range)
                                 
                                 
                                 if break_com:
@@ -1195,10 +1200,17 @@ def handle_beacon_detection(image_queue):
             
 
 
-            if ping_num[id] >= PING_THRESHOLD: # If the desired number of pings appears, then call the find_solution()
+            if EARLY_SUBMIT_MASS is not None and ping_num[id] != guessed_pings: # Posterior of the new pings
+                guessed_pings = ping_num[id]
+                guesses = beacon_guesses(id, 1)
+                early_guess = guesses[0] if guesses and guesses[0][1] >= EARLY_SUBMIT_MASS else None
+            if ping_num[id] >= PING_THRESHOLD or early_guess is not None: # Enough pings, or a guess likely enough
                 set_mode('charge', check['vx'], check['vy'], check['angle'])
                 wait('charge') # Wait to get to charge mode first
-                width, height = find_solution() # Function that estimates the Beacon's location based on gemoetric loci
+                if early_guess is not None:
+                    width, height = early_guess[0]
+                else:
+                    width, height = find_solution(PINGS, id) # Function that estimates the Beacon's location based on gemoetric loci
                 if DEBUG:
                     print("============================= BEACON LOCATION FOUND ==========================")
             
@@ -1247,23 +1259,35 @@ def beacon_check_routine(image_queue):
     global ping_num
 
     trials = 0
+    guesses = [] # Next guesses from the same pings, submitted without waiting for new ones
 
     while trials < 3: # Try to submit 3 times
-        check = get_observation()
-        vx, vy, angle = check['vx'], check['vy'], check['angle']
-        set_mode('communication', vx, vy, angle) # Need to change to communication mode immediately
-        wait('communication')
+        fake_fail = False
+        if guesses:
+            (width, height), mass = guesses.pop(0)
+            if DEBUG:
+                print(f"[BEACON ROUTINE] Trying the next guess ({width}, {height}), hit probability {mass:.2f}")
+        else:
+            check = get_observation()
+            vx, vy, angle = check['vx'], check['vy'], check['angle']
+            set_mode('communication', vx, vy, angle) # Need to change to communication mode immediately
+            wait('communication')
 
-        if DEBUG:
-            print(f"[BEACON ROUTINE] Going to find solution number {trials + 1}")
-        width, height = handle_beacon_detection(image_queue, trials) # Take the optimal solution estimation
+            if DEBUG:
+                print(f"[BEACON ROUTINE] Going to find solution number {trials + 1}")
+            width, height = handle_beacon_detection(image_queue) # Take the optimal solution estimation
 
-        fake_fail = False
-        if width == -1 and height == -1:
-            trials = 3
-            break
-        elif width == -2 and height == -2:
-            fake_fail = True
+            if width == -1 and height == -1:
+                trials = 3
+                break
+            elif width == -2 and height == -2:
+                fake_fail = True
+            else:
+                # The guesses hitting most often in turn, the estimation only without announced distances
+                guesses = beacon_guesses(id, 3 - trials)
+                if guesses:
+                    (width, height), mass = guesses.pop(0)
+                guesses = [guess for guess in guesses if guess[1] >= MIN_GUESS_MASS]
 
         if not fake_fail:
             result = submit_EB(beacon_id, width, height)
@@ -1282,6 +1306,9 @@ def beacon_check_routine(image_queue):
         else: # Case of failure
             pattern1 = r"{\"status\": \"The beacon could not be found around the given location\", \"attempts_made\": (\d+)}"
             match1 = re.search(pattern1, result)
+            if match1 and guesses: # Another guess is likely enough to skip waiting for new pings
+                trials += 1
+                continue
             if match1 or fake_fail: # Did not found EB location correctly
                 if DEBUG:
                     simulation(False,20)
@@ -1302,15 +1329,9 @@ def beacon_check_routine(image_queue):
                     vy = check['vy'] + 2
                 if DEBUG:
                     print("[BEACON ROUTINE] Waiting to reach desired velocity...")
-                while True:
-                    set_mode('acquisition', vx, vy, check['angle']) # Change orbit
-                    check = get_observation()
-                    if check["vx"] == vx and check["vy"] == vy:
-                        if DEBUG:
-                            print("[BEACON ROUTINE] Reached desired velocity")
-                        break
-                    safe("communication") 
-                    protect_battery(5, check["angle"], "communication")
+                check = await_velocity(vx, vy, check['angle'], 5, "communication") # Change orbit, sent once
+                if DEBUG:
+                    print("[BEACON ROUTINE] Reached desired velocity")
                     
                 if not fake_fail:
                     trials += 1 # Tried and failed
@@ -1327,18 +1348,9 @@ def beacon_check_routine(image_queue):
             file.write(f"\nBeacon with id {id} failed to be submitted.\n")
 
 
-    if os.path.exists(PING_LOG_FILE_PATH):
-        if DEBUG:
-            print("[BEACON ROUTINE] Archiving ping log data.")
-
-        # Write the logs to the file
-
-        with open(PING_LOG_FILE_PATH, 'r', encoding="utf-8") as src, open('ping_log_archive.txt', 'a', encoding="utf-8") as dst:
-            for line in src:
-                dst.write(line)  
-
-        with open(PING_LOG_FILE_PATH, 'w', encoding="utf-8"):
-            pass  
+    if DEBUG:
+        print("[BEACON ROUTINE] Archiving ping log data.")
+    PINGS.archive()
 
     beacon_active.clear()
     if DEBUG:
@@ -1354,179 +1366,26 @@ def beacon_check_routine(image_queue):
 
 
 # ----------------- CREATION OF BIT MATRIX - A REPRESENTATION OF THE MAP ------------------
-class BitMatrix:
-    '''
-    A space-efficient binary matrix using a bit array, optimized for fast operations.
-    '''
-    def __init__(self, width=21600, height=10800):
-        """
-        Initializes a binary matrix with given width and height.
-        
-        :param width: Number of columns in the matrix.
-        :param height: Number of rows in the matrix.
-        :initial: The initialization value of the matrix.
-        """
-        self.width = width
-        self.height = height
-        self.data = bitarray(width * height)
-        self.data.setall(0)
-        self.points_taken = 0
-
-    def _check_bounds(self, x, y):
-        """
-        Ensures that given coordinates (x, y) are within valid matrix bounds.
-        
-        :raises IndexError: If (x, y) is out of bounds.
-        """
-        if not (0 <= x < self.width and 0 <= y < self.height):
-            raise IndexError(f"[ERROR] Coordinates ({x}, {y}) out of bounds")
-
-    def _index(self, x, y):
-        """
-        Converts 2D coordinates (x, y) to a 1D index for the bit array.
-        
-        :return: Integer index corresponding to (x, y).
-        """
-        return y * self.width + x
+Map = CoverageGrid(width=21600, height=10800)
+MAP_RESYNC = True # At startup, rebuild Map from the stitched canvas (instead of loading "backup_map.bmap")
 
-    def set_bit(self, x, y, value):
-        """
-        Sets a bit at position (x, y) to 0 or 1.
-        
-        :param x: X-coordinate.
-        :param y: Y-coordinate.
-        :param value: Boolean value (0 or 1) to set.
-        """
-        self._check_bounds(x, y)
-        self.data[self._index(x, y)] = bool(value)
-
-    def get_bit(self, x, y):
-        """
-        Retrieves the bit value at position (x, y).
-        
-        :param x: X-coordinate.
-        :param y: Y-coordinate.
-        :return: Boolean value of the bit at (x, y).
-        """
-        self._check_bounds(x, y)
-        return self.data[self._index(x, y)]
-
-    def update_map(self, x, y, angle, value):
-        """
-        Updates a square region around (x, y) based on camera angle.
-        
-        :param x: X-coordinate of center.
-        :param y: Y-coordinate of center.
-        :param angle: Camera angle ('wide', 'normal', or 'narrow') defining update range.
-        :param value: Boolean value (0 or 1) to set.
-        """
-        lens_to_range = {'wide': 500, 'normal': 400, 'narrow': 300}
-        range_val = lens_to_range[angle]
-
-        if value == 1:
-            self.points_taken += (2 * range_val) ** 2
-        else:
-            self.points_taken -= (2 * range_val) ** 2
-
-        if range_val not in [300, 400, 500]:
-            raise ValueError("[ERROR] Range must be one of: 300, 400, 500")
-
-        x_min = max(0, x - range_val)
-        x_max = min(self.width - 1, x + range_val)
-        y_min = max(0, y - range_val)
-        y_max = min(self.height - 1, y + range_val)
-
-        bool_value = bool(value)
-        width_span = x_max - x_min + 1
-
-        row_template = bitarray(int(width_span))
-        row_template.setall(bool_value)
-
-        # fast copy operations for each row
-        for y_pos in range(y_min, y_max + 1):
-            start_idx = self._index(x_min, y_pos)
-            # set the entire row segment at once
-            self.data[start_idx:start_idx + width_span] = row_template
-
-    def print_matrix(self, step=500):
-        """
-        Print a compact representation of the matrix, using step sampling.
-
-        :param step: Sampling step size for visualization.
-        """
-        if DEBUG:
-            print()
-        # Calculate sampled dimensions
-        sample_width = min(self.width // step + 1, 80)  # Limit width for terminal
-        sample_height = min(self.height // step + 1, 40)  # Limit height for readability
-
-        if DEBUG:
-            print("    ", end="")
-            for _ in range(sample_width):
-                print("_", end="")
-            print()
-
-        for y_idx in range(sample_height):
-            y = y_idx * step
-            if DEBUG:
-                print(f"{y//1000:2d}k| ", end="")
-
-            for x_idx in range(sample_width):
-                x = x_idx * step
-                if x < self.width and y < self.height:
-                    value = self.get_bit(x, y)
-                    if DEBUG:
-                        print("■" if value else "·", end="")
-                else:
-                    if DEBUG:
-                        print(" ", end="")
-            if DEBUG:
-                print()
-
-    def save_to_file(self, filename, compress=False):
-        """
-        Saves the matrix to a binary file for storage.
-        
-        :param filename: File path to save the data.
-        :param compress: If True, compresses data before saving.
-        """
-        header = struct.pack('<IIQ?', self.width, self.height, self.points_taken, compress)
-
-        # Prepare data
-        raw_data = self.data.tobytes()
-        if compress:
-            raw_data = zlib.compress(raw_data)
-
-        with open(filename, 'wb') as f:
-            f.write(header)
-            f.write(raw_data)
-
-    @classmethod
-    def load_from_file(cls, filename):
-        """
-        Loads a BitMatrix object from a previously saved file.
-        
-        :param filename: File path to load the data from.
-        :return: A BitMatrix instance with restored data.
-        """
-        with open(filename, 'rb') as f:
-            header = f.read(struct.calcsize('<IIQ?'))
-            width, height, points_taken, compress = struct.unpack('<IIQ?', header)
-
-            raw_data = f.read()
-            if compress:
-                raw_data = zlib.decompress(raw_data)
-
-            bitmat = cls(width, height)
-            bitmat.points_taken = points_taken
-            bitmat.data = bitarray()
-            bitmat.data.frombytes(raw_data)
-        return bitmat
-
-
-
-Map = BitMatrix(width=21600, height=10800)
-# Map = BitMatrix.load_from_file("backup_map.bmap") # In case we need to load a backup
+def resync_map():
+    """
+    Rebuilds the coverage map from the pixels already stitched on the on-disk canvas, so that a restart does not
+    forget what was photographed: the pixels of a good enough quality (see quality_layer.GOOD_QUALITY), or the
+    non-black ones of a canvas stitched before its quality layer. Runs before the stitching process starts
+    writing to the canvas.
+    """
+    global Map
+    if not os.path.exists(CANVAS_FILE):
+        return
+    start = time.monotonic()
+    if os.path.exists(quality_file(CANVAS_FILE)):
+        Map = CoverageGrid.from_quality(open_quality(quality_file(CANVAS_FILE), 'r'), GOOD_QUALITY, read_stitched_canvas())
+    else:
+        Map = CoverageGrid.from_canvas(read_stitched_canvas())
+    if DEBUG:
+        print(f"[MAP] Resynchronized from the canvas in {time.monotonic() - start:.1f} s: {Map.points_taken} pixels covered")
 
 # -----------------------------------------------------------------------------------------
 
@@ -1547,7 +1406,7 @@ def get_trajectory(x = -1,y = -1,vx = -1,vy = -1):
     :param steps: Number of steps to simulate
     :param start: Starting point (x, y)
     :param map_size: Size of the map (width, height)
-    :return: List of (x, y) positions within map bounds
+    :return: Array of (x, y) positions within map bounds, one row per second
     """
     if x == -1 or y == -1 or vx == -1 or vy == -1:
         check = get_observation()
@@ -1556,25 +1415,9 @@ def get_trajectory(x = -1,y = -1,vx = -1,vy = -1):
         vx = check["vx"]
         vy = check["vy"]
         
-    width, height = (21600,10800)
-    trajectory = []
-    steps = max(round(21600/vx),round(10800/vy))
-    for _ in range(steps):
-        x += vx
-        y += vy
-        
-        # Ensure the position stays within map bounds
-        if x>width-1:
-            x = x-width+1
-        if y>height-1:
-            y = y-height+1    
-        
-        # x = max(0, min(width - 1, round(x)))
-        # y = max(0, min(height - 1, round(y)))
-        
-        trajectory.append((round(x), round(y)))
-    
-    return trajectory
+    # Whole wrapped ground track at once, the displacements are cached per velocity
+    xs, ys = ground_track(x, y, vx, vy)
+    return np.column_stack((xs, ys))
 
 def think_about_it(list):
     """
@@ -1585,15 +1428,7 @@ def think_about_it(list):
     
     
     """
-    global Map
-    good = False
-    # print(list) # debug
-    for i in list:
-        # if Map.get_bit(i[1],i[0]) == 0:
-        if Map.get_bit(i[0],i[1]) == 0:
-            good = True
-            break
-    return good
+    return Map.first_vacant(list) != (-1, -1)
 
 def change_speed(x,y,battery_order):
     """
@@ -1604,141 +1439,15 @@ def change_speed(x,y,battery_order):
     """
     
     
-    set_mode("acquisition",x, y,"wide")
-    wait("acquisition")
-    if not DEBUG:    
-        while True:
-            safe()
-            set_mode("acquisition",x,y,"wide")
-            time.sleep(0.2)
-            protect_battery(battery_order)
-            time.sleep(0.2)
-            check = get_observation()
-            if check["vx"] == x and check["vy"] == y:
-                break
-    else :
-        if DEBUG:
-            simulation(False,20)
-        while True:
-            safe()
-            set_mode("acquisition",x,y,"wide")
-            time.sleep(0.2)
-            protect_battery(battery_order)
-            time.sleep(0.2)
-            check = get_observation()
-            if check["vx"] == x and check["vy"] == y:
-                break    
-        if DEBUG:     
-            simulation(False,1)
-
+    if DEBUG:
+        simulation(False,20)
+    # Sent once, then checked on each new observation until melvin flies at (x, y)
+    await_velocity(x, y, "wide", battery_order)
+    if DEBUG:
+        simulation(False,1)
 
 
 
-def mod_signed_diff(a, b, mod_val):
-    """
-    Returns the signed minimal difference between a and b on a circle of circumference mod_val.
-    The result lies in [-mod_val/2, mod_val/2].
-    :param a: First value
-    :param b: Second value
-    :param mod_val: Modulus value (circumference of the circle)
-    """
-    diff = (a - b) % mod_val
-    if diff > mod_val/2:
-        diff -= mod_val
-    return diff
-
-def calculate_travel_time(x, y, vx, vy, dest_x, dest_y, width=21600, height=10800, tolerance=2):
-    """
-    Calculates the time (in seconds) required to reach (dest_x, dest_y) from (x, y)
-    with constant velocities (vx, vy) in a wrap-around world (toroidal map). 
-    The function finds the first time t >= 0 such that both:
-    
-        |mod(x + vx*t - dest_x, width)| <= tolerance
-        |mod(y + vy*t - dest_y, height)| <= tolerance
-    
-    If one of the velocity components is zero and the corresponding coordinate 
-    is not already within tolerance, the destination is unreachable (returns infinity).
-    
-    The method computes, for each moving coordinate, the sequence of times when the
-    coordinate “crosses” the destination (modulo the wrap) and the small time window 
-    around that crossing when the coordinate is within tolerance. Then it looks for the 
-    earliest time when both x and y are simultaneously within tolerance.
-    :param x: Current x-coordinate
-    :param y: Current y-coordinate
-    :param vx: Velocity in x-direction
-    :param vy: Velocity in y-direction
-    :param dest_x: Destination x-coordinate
-    :param dest_y: Destination y-coordinate
-    :param width: Width of the map (wrap-around)
-    :param height: Height of the map (wrap-around)
-    :param tolerance: Tolerance for reaching the destination
-    """
-    
-    # Handle the non-moving axes.
-    if vx == 0:
-        if abs(mod_signed_diff(x, dest_x, width)) > tolerance:
-            return float('inf')
-        # x is always valid; treat its valid time window as [0, ∞)
-        x_intervals = [(0, float('inf'))]
-    else:
-        x_intervals = []
-        # Determine the period for x
-        period_x = width / abs(vx)
-        # We will check over a range of wrap counts.
-        # Estimate number of periods to check (say 100 periods)
-        N_periods = 100
-        # Choose a range for n. We solve: t_cross = (dest_x - x + n*width)/vx >= 0.
-        # For safety, check n values in an interval that likely covers up to N_periods periods.
-        n_min = int(math.floor(-width and ((dest_x - x) / width))) - 1
-        n_max = n_min + N_periods
-        for n in range(n_min, n_max+1):
-            t_cross = (dest_x - x + n * width) / vx
-            if t_cross < 0:
-                continue
-            # At t_cross the x coordinate exactly equals dest_x modulo width.
-            # With constant velocity, the coordinate changes at rate |vx|.
-            # Thus the time window during which the x position is within tolerance is:
-            dt = tolerance / abs(vx)
-            # The valid interval for x is:
-            interval = (t_cross - dt, t_cross + dt)
-            # Ensure the interval lower bound is nonnegative.
-            x_intervals.append((max(interval[0], 0), interval[1]))
-    
-    if vy == 0:
-        if abs(mod_signed_diff(y, dest_y, height)) > tolerance:
-            return float('inf')
-        y_intervals = [(0, float('inf'))]
-    else:
-        y_intervals = []
-        period_y = height / abs(vy)
-        N_periods = 100
-        n_min = int(math.floor((dest_y - y) / height)) - 1
-        n_max = n_min + N_periods
-        for n in range(n_min, n_max+1):
-            t_cross = (dest_y - y + n * height) / vy
-            if t_cross < 0:
-                continue
-            dt = tolerance / abs(vy)
-            interval = (t_cross - dt, t_cross + dt)
-            y_intervals.append((max(interval[0], 0), interval[1]))
-    
-    # Now find the earliest time t >= 0 where an x-interval overlaps a y-interval.
-    candidate_time = float('inf')
-    for (t_start_x, t_end_x) in x_intervals:
-        for (t_start_y, t_end_y) in y_intervals:
-            # Find intersection of intervals
-            t_start = max(t_start_x, t_start_y)
-            t_end = min(t_end_x, t_end_y)
-            if t_start <= t_end:
-                candidate_time = min(candidate_time, t_start)
-    
-    if candidate_time == float('inf'):
-        return float('inf')
-    
-    # Return the time rounded to the nearest integer second.
-    return int(round(candidate_time))
-
-
 
 def part4_main():
     """
@@ -1746,7 +1455,10 @@ def part4_main():
     beacon handler and objective handler when the time comes.
     """
     try:
+        start_runtime()
         safe()
+        if MAP_RESYNC:
+            resync_map()
         image_queue = start_stitching_process()
 
         if DEBUG:
@@ -1836,61 +1548,31 @@ def part4_main():
                 set_mode("charge", current["vx"], current["vy"], current["angle"])
                 
                 if DEBUG:
-                    print("[DAILY PILOT] scanning the whole Map... this might take from 20 seconds to 40 seconds maximum")
+                    print("[DAILY PILOT] scanning the whole Map...")
                 target = (-1,-1)
                 start = datetime.now()
                 step_specific = 500
-                for i in range(0,21600,step_specific):
-                    for j in range(0,10800,step_specific):
-                        #if goes wrong comment all this till 
-                        vacant = 0
-                        detection_range = 500
-                        
-                        for x in range(current["width_x"]-detection_range, current["width_x"]+detection_range):
-                            for y in range(current["height_y"]-detection_range,current["height_y"]+detection_range):
-                                if x<0:
-                                    x = 21599 + x
-                                if y<0:
-                                    y = 10799 + y
-                                
-                                if x>21599:
-                                    x = x - 21599
-                                if y > 10799:
-                                    y = y - 10799
-                                if  Map.get_bit(x,y) == 0:
-                                    vacant += 1
-                                
-                        if DEBUG:
-                            print("Thought this : ",i,j)
-                            print("the important percentages : ", vacant/(1000*1000),(21600 * 10800 - Map.points_taken) / (21600*10800))
-                        if vacant/(1000*1000) >= (21600 * 10800 - Map.points_taken) / (21600*10800):
-                            target = (i,j)
-                            
-                            break
-                        if target!=(-1,-1):
-                            break
-                    if target != (-1,-1):
-                        break
-                        #HERE AND UNCOMMEND
-                        
-                        # if Map.get_bit(j,i) == 0:
-                        # if Map.get_bit(i,j) == 0:
-                        #     target = (i,j)
-                        #     break
-                        #HERE AND YOU WILL BE GOOD
-                    if i%4000 == 0:
-                        if beacon_check_routine(image_queue):
-                            if DEBUG :
-                                print("[DAILY PILOT] sending to beacon handler and then breaking")
-                            hold_fast = True
-                            break
-                        
-                        if objective_check_routine(image_queue):
-                            if DEBUG:
-                                print("[DAILY PILOT] sending to objective handler and then breaking")
-                            hold_fast = True
-                            break    
-                
+                detection_range = 500
+                # Every candidate window is ranked by uncovered pixels per second of travel and maneuvering
+                plan = plan_targets(Map, current, 2 * detection_range, step_specific,
+                                    min_vacant=(1000*1000) * (21600 * 10800 - Map.points_taken) / (21600*10800),
+                                    tolerance=detection_range // 2)
+                if plan:
+                    if DEBUG:
+                        print("Thought this : ",plan[0]["x"],plan[0]["y"])
+                        print("the important percentages : ", plan[0]["vacant"]/(1000*1000),(21600 * 10800 - Map.points_taken) / (21600*10800))
+                    target = (plan[0]["x"],plan[0]["y"])
+
+                if beacon_check_routine(image_queue):
+                    if DEBUG :
+                        print("[DAILY PILOT] sending to beacon handler and then breaking")
+                    hold_fast = True
+
+                elif objective_check_routine(image_queue):
+                    if DEBUG:
+                        print("[DAILY PILOT] sending to objective handler and then breaking")
+                    hold_fast = True
+
                 if hold_fast:
                     continue
                 ###################################### step decreasing 
@@ -1914,11 +1596,7 @@ def part4_main():
                 
                 
                 l = get_trajectory()
-                save = (-1,-1)
-                for i in l:
-                    if Map.get_bit(i[0],i[1]) == 0: 
-                        save = i
-                        break
+                save = Map.first_vacant(l)
                 current = get_observation()
                 
                 if DEBUG:
@@ -1949,7 +1627,7 @@ def part4_main():
                     sleeping_time_for_this_for_loop_only = round(time_calculated/50,2)
                     for i in range(1,50):
                         
-                        time.sleep(sleeping_time_for_this_for_loop_only)
+                        interruptible_sleep(sleeping_time_for_this_for_loop_only, interrupt_pending)
                         
                         if beacon_check_routine(image_queue):
                             if DEBUG :
@@ -1981,11 +1659,7 @@ def part4_main():
                         
                         l = get_trajectory()
                         total = len(l)
-                        vacant = 0
-                        
-                        for i in l:
-                            if Map.get_bit(i[0],i[1]) == 0: 
-                                vacant+=1
+                        vacant = Map.count_vacant(l)
                                 
                         
                         if DEBUG:
@@ -2024,24 +1698,8 @@ def part4_main():
                     #protect_battery(battery_order)
                     current = get_observation()
                     defender = False
-                    break_com = False
                     detection_range = 300
-                    for x in range(current["width_x"]-detection_range, current["width_x"]+detection_range):
-                        for y in range(current["height_y"]-detection_range,current["height_y"]+detection_range):
-                            if x<0:
-                                x = 21599 + x
-                            if y<0:
-                                y = 10799 + y
-                            if x>21599:
-                                x = x - 21599
-                            if y > 10799:
-                                y = y - 10799
-                                
-                            if Map.get_bit(x,y) == 0:
-                                break_com = True
-                                break
-                        if break_com == True:
-                            break
+                    break_com = not Map.area_covered(current["width_x"], current["height_y"], detection_range)
                     
                     
                     if break_com:
@@ -0,0 +1,190 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+DEBUG = False
+
+LENS_SIZE = {'1': 1000, '8': 800, '6': 600} # Wide, normal, narrow
+RECENT_PHOTOS = 200 # Encoded photos kept in memory for the objective stitcher (~100 kB each)
+
+
+class ResizePlan:
+    '''
+    Resize of the photos of one lens to its footprint on the map: fixed output size and interpolation, plus one
+    preallocated output buffer per thread. Resizing into the buffer, or straight into a view of the canvas,
+    avoids allocating (and later copying) a fresh 3 MB array for every photo.
+    '''
+    def __init__(self, size, interpolation=cv2.INTER_LINEAR):
+        """
+        :param size: Side in pixels of the footprint.
+        :param interpolation: OpenCV interpolation flag.
+        """
+        self.size = size
+        self.interpolation = interpolation
+        self._local = threading.local()
+
+    def buffer(self):
+        """
+        Returns the output buffer of the calling thread. It is overwritten by the next resize into it, so its
+        content must be consumed (pasted, copied to the ring...) before that.
+        """
+        out = getattr(self._local, "out", None)
+        if out is None:
+            out = self._local.out = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        return out
+
+    def resize(self, img, out=None):
+        """
+        Resizes an image to the footprint.
+
+        :param img: BGR image.
+        :param out: (size, size, 3) uint8 array to write into: buffer() or a view of the canvas. None to allocate.
+        :return: The resized image (out when given).
+        """
+        if img.shape[:2] == (self.size, self.size):
+            if out is None:
+                return img
+            out[...] = img
+            return out
+        return cv2.resize(img, (self.size, self.size), dst=out, interpolation=self.interpolation)
+
+
+RESIZE_PLANS = {size: ResizePlan(size) for size in LENS_SIZE.values()}
+
+
+def resize_plan(size):
+    """
+    Returns the resize plan of a footprint size (shared for the lens sizes).
+    """
+    plan = RESIZE_PLANS.get(size)
+    if plan is None:
+        plan = RESIZE_PLANS[size] = ResizePlan(size)
+    return plan
+
+
+def decode_photo(data, size=None, out=None):
+    """
+    Decodes the bytes of a photo (as returned by /image) and resizes it to its footprint on the map.
+
+    :param data: Encoded image bytes.
+    :param size: Side in pixels of the footprint, None to keep the original size.
+    :param out: Array to resize into (see ResizePlan.resize), None to allocate one.
+    :return: The BGR image, or None if it cannot be decoded.
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    if size is not None:
+        img = resize_plan(size).resize(img, out)
+    return img
+
+
+def footprint_size(filename):
+    """
+    Returns the side in pixels of the footprint of a photo from its name (images/lens{precision}_{x}_{y}.jpg).
+    """
+    precision = os.path.basename(filename).split('_')[0].replace('lens', '')
+    return LENS_SIZE.get(precision)
+
+
+class ArchiveWriter:
+    '''
+    Writes the photos to the images folder from a background thread, so that taking a photo never waits for the
+    disk. The archive is only for later use (rebuilds, debugging), nothing on the hot path reads it back.
+    '''
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="archive-writer")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                with open(path, "wb") as img_file:
+                    img_file.write(data)
+                self.written += 1
+            except OSError as e:
+                self.failed += 1
+                print(f"[ERROR] Failed to archive {path}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def write(self, path, data):
+        """
+        Queues a photo to be written to disk.
+        """
+        self._start()
+        self._queue.put((path, data))
+
+    def flush(self):
+        """
+        Blocks until every queued photo is on disk.
+        """
+        self._queue.join()
+
+
+class RecentPhotos:
+    '''
+    The last photos taken, encoded, by file name (without folder). Thread-safe, oldest dropped first.
+    '''
+    def __init__(self, capacity=RECENT_PHOTOS):
+        self.capacity = capacity
+        self._photos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, filename, data):
+        with self._lock:
+            self._photos[os.path.basename(filename)] = data
+            self._photos.move_to_end(os.path.basename(filename))
+            while len(self._photos) > self.capacity:
+                self._photos.popitem(last=False)
+
+    def get(self, filename):
+        with self._lock:
+            return self._photos.get(os.path.basename(filename))
+
+
+ARCHIVE = ArchiveWriter()
+RECENT = RecentPhotos()
+
+
+if __name__ == '__main__':
+    # Micro-benchmark of the resize stage on realistic 1000x1000 JPEG photos
+    import time
+    rng = np.random.default_rng(0)
+    photo = cv2.GaussianBlur(rng.integers(0, 256, (1000, 1000, 3), dtype=np.uint8), (0, 0), 3)
+    data = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+    canvas = np.zeros((3000, 3000, 3), dtype=np.uint8)
+    runs = 50
+
+    def bench(label, func):
+        func()
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        print(f"{label:<40}{(time.perf_counter() - start) / runs * 1e3:8.2f} ms")
+
+    img = decode_photo(data)
+    bench("decode only", lambda: decode_photo(data))
+    for size in sorted(LENS_SIZE.values()):
+        plan = resize_plan(size)
+        view = canvas[1000:1000 + size, 1000:1000 + size]
+        print(f"--- footprint {size}x{size}")
+        bench("resize, new array + paste", lambda: view.__setitem__(Ellipsis, cv2.resize(img, (size, size))))
+        bench("resize into buffer + paste", lambda: view.__setitem__(Ellipsis, plan.resize(img, plan.buffer())))
+        bench("resize into the canvas view", lambda: plan.resize(img, view))
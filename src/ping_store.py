@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+DEBUG = False
+
+PING_STORE_FILE = "ping_log.jsonl" # One JSON object per ping, appended as they arrive
+PING_ARCHIVE_FILE = "ping_log_archive.jsonl" # Pings of the beacons already handled
+LEGACY_PING_LOG_FILE = "ping_log.txt" # Text log of the previous versions, imported once then renamed
+LEGACY_SUFFIX = ".migrated"
+LEGACY_LINE = re.compile(r"\[BEACON SUCCESS\] PING for Beacon with ID: (\S+) found at (\S+) , (\S+), "
+                         r"with actual distance: (\S+) - Timestamp: (.+)")
+
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text else value
+
+
+def parse_legacy_line(line):
+    """
+    Converts a line of the legacy text log into a ping (without the noisy distance, which was not logged).
+
+    :return: The ping, or None if the line does not match.
+    """
+    match = LEGACY_LINE.search(line)
+    if match is None:
+        return None
+    beacon_id, x, y, distance, timestamp = match.groups()
+    try:
+        timestamp = datetime.fromisoformat(timestamp.strip()).isoformat()
+    except ValueError:
+        timestamp = timestamp.strip()
+    return {"beacon": _number(beacon_id), "x": _number(x), "y": _number(y), "distance": _number(distance),
+            "noisy": None, "time": timestamp}
+
+
+class PingStore:
+    '''
+    The pings received from the emergency beacons, indexed by beacon in memory and persisted to an append-only
+    JSONL file. The file is only read once, when the store is created (e.g. after a restart or by the safety
+    handler), every lookup afterwards is served from memory: the latest ping of a beacon in O(1), all its pings
+    in O(k).
+
+    A ping is a dict: beacon, x, y (MELVIN's position), distance (estimated actual distance), noisy (the distance
+    announced by the beacon) and time.
+    '''
+    def __init__(self, path=PING_STORE_FILE, legacy_path=LEGACY_PING_LOG_FILE):
+        """
+        :param path: JSONL file of the pings, replayed if it exists.
+        :param legacy_path: Text log of the previous versions, imported into path once if it exists (None to skip).
+        """
+        self.path = path
+        self._pings = defaultdict(list) # beacon id -> pings in arrival order
+        self._last = None # Latest ping of any beacon
+        self._lock = threading.Lock()
+        self._file = None
+        self._torn = False # The file ends with a line cut by a crash
+        if legacy_path is not None:
+            self.import_legacy(legacy_path)
+        self.replay()
+
+    def import_legacy(self, legacy_path=LEGACY_PING_LOG_FILE):
+        """
+        Appends the pings of a legacy text log to the file, then renames the log with LEGACY_SUFFIX so that it is
+        imported only once. Lines that do not match are skipped. Call replay() afterwards to load them.
+
+        :return: The number of pings imported.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        with self._lock:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                pings = [ping for ping in map(parse_legacy_line, f) if ping is not None]
+            if pings:
+                with open(self.path, "a+", encoding="utf-8") as f:
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() > 0:
+                        f.seek(f.tell() - 1)
+                        if f.read(1) != "\n":
+                            f.write("\n") # Keeps a line cut by a crash from swallowing the first import
+                    f.writelines(json.dumps(ping) + "\n" for ping in pings)
+            os.replace(legacy_path, legacy_path + LEGACY_SUFFIX)
+        if DEBUG:
+            print(f"[PINGS] Imported {len(pings)} pings from {legacy_path}")
+        return len(pings)
+
+    def replay(self):
+        """
+        Reloads the pings from the file. A line cut by a crash is skipped.
+
+        :return: The number of pings loaded.
+        """
+        with self._lock:
+            self._pings.clear()
+            self._last = None
+            self._torn = False
+            if not os.path.exists(self.path):
+                return 0
+            loaded = 0
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._torn = not line.endswith("\n")
+                    try:
+                        ping = json.loads(line)
+                    except json.JSONDecodeError:
+                        if DEBUG:
+                            print(f"[PINGS] Skipping a corrupted line of {self.path}")
+                        continue
+                    self._pings[ping["beacon"]].append(ping)
+                    self._last = ping
+                    loaded += 1
+            return loaded
+
+    def add(self, beacon_id, x, y, distance, noisy=None):
+        """
+        Records a ping in memory and appends it to the file.
+
+        :param beacon_id: ID of the beacon.
+        :param x: X-coordinate of MELVIN when the ping was received.
+        :param y: Y-coordinate of MELVIN when the ping was received.
+        :param distance: Estimated actual distance to the beacon.
+        :param noisy: Distance announced by the beacon (with noise).
+        :return: The stored ping.
+        """
+        ping = {"beacon": beacon_id, "x": x, "y": y, "distance": distance, "noisy": noisy,
+                "time": datetime.now().isoformat()}
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._torn:
+                    self._file.write("\n") # Keeps the cut line from swallowing this one
+                    self._torn = False
+            self._file.write(json.dumps(ping) + "\n")
+            self._file.flush()
+            self._pings[beacon_id].append(ping)
+            self._last = ping
+        return ping
+
+    def latest(self, beacon_id=None):
+        """
+        Returns the latest ping of a beacon (of any beacon if None), or None if there is none.
+        """
+        with self._lock:
+            if beacon_id is None:
+                return self._last
+            pings = self._pings.get(beacon_id)
+            return pings[-1] if pings else None
+
+    def pings(self, beacon_id):
+        """
+        Returns the pings of a beacon, in arrival order.
+        """
+        with self._lock:
+            return list(self._pings.get(beacon_id, ()))
+
+    def beacons(self):
+        """
+        Returns the IDs of the beacons with at least one ping, in order of first ping.
+        """
+        with self._lock:
+            return [beacon_id for beacon_id, pings in self._pings.items() if pings]
+
+    def archive(self, archive_path=PING_ARCHIVE_FILE):
+        """
+        Moves every ping to the archive file and starts over with an empty store.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as src, open(archive_path, "a", encoding="utf-8") as dst:
+                    for line in src:
+                        dst.write(line if line.endswith("\n") else line + "\n")
+                open(self.path, "w").close()
+            self._pings.clear()
+            self._last = None
+            self._torn = False
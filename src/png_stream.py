@@ -0,0 +1,95 @@
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+DEBUG = False
+
+ROWS_PER_BLOCK = 256 # Rows filtered and compressed at once (~16 MB of a 21600 px wide map)
+COMPRESSION_LEVEL = 6 # zlib level, 9 is barely smaller and much slower on photos
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COMPRESS_THREADS = 4 # Blocks compressed in parallel (zlib releases the GIL)
+FILTER_UP = 2 # PNG row filter: difference with the row above
+ZLIB_HEADER = b'\x78\x9c' # Deflate, 32 kB window
+
+
+def _chunk(kind, data):
+    """
+    Builds a PNG chunk (length, type, data, CRC).
+    """
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+
+def _encode_block(canvas, start, rows_per_block, level, last):
+    """
+    Filters a block of rows and compresses it as an independent deflate segment (byte aligned, so that the
+    segments of all the blocks concatenate into one valid stream).
+
+    :return: (filtered bytes, compressed bytes).
+    """
+    width = canvas.shape[1]
+    rows = np.ascontiguousarray(canvas[start:start + rows_per_block, :, ::-1]).reshape(-1, width * 3) # BGR -> RGB
+    if start == 0:
+        previous = np.zeros((1, width * 3), dtype=np.uint8)
+    else:
+        previous = np.ascontiguousarray(canvas[start - 1:start, :, ::-1]).reshape(1, width * 3)
+    filtered = np.empty((rows.shape[0], width * 3 + 1), dtype=np.uint8)
+    filtered[:, 0] = FILTER_UP
+    # uint8 arithmetic wraps modulo 256, as the filter expects
+    np.subtract(rows[:1], previous, out=filtered[:1, 1:])
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(filtered.data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return filtered, data
+
+
+def png_chunks(canvas, rows_per_block=ROWS_PER_BLOCK, level=COMPRESSION_LEVEL, threads=COMPRESS_THREADS):
+    """
+    Encodes a BGR image (e.g. the memmapped canvas) as PNG, one block of rows at a time.
+    Only a few blocks of rows are in memory at once and the first bytes are available before the whole map is
+    read, so the PNG can be written or uploaded while it is being encoded.
+
+    :param canvas: (height, width, 3) uint8 array in BGR order, as stored by OpenCV.
+    :param rows_per_block: Rows encoded per IDAT chunk.
+    :param level: zlib compression level.
+    :param threads: Blocks compressed in parallel.
+    :return: Generator of the bytes of the PNG file.
+    """
+    height, width = canvas.shape[:2]
+    yield PNG_SIGNATURE
+    yield _chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) # 8 bits RGB
+
+    yield _chunk(b'IDAT', ZLIB_HEADER)
+    checksum = zlib.adler32(b'')
+    last = (height - 1) // rows_per_block * rows_per_block
+    pending = deque() # Blocks being compressed, yielded in order
+    with ThreadPoolExecutor(max(threads, 1)) as pool:
+        for start in range(0, height, rows_per_block):
+            pending.append(pool.submit(_encode_block, canvas, start, rows_per_block, level, start == last))
+            while len(pending) > threads or (pending and start == last):
+                filtered, data = pending.popleft().result()
+                checksum = zlib.adler32(filtered.data, checksum)
+                yield _chunk(b'IDAT', data)
+    yield _chunk(b'IDAT', struct.pack(">I", checksum))
+    yield _chunk(b'IEND', b'')
+
+
+def write_png(canvas, path, rows_per_block=ROWS_PER_BLOCK, level=COMPRESSION_LEVEL):
+    """
+    Streams a BGR image to a PNG file. The file is written under a temporary name and renamed when complete,
+    so a reader never sees half a map.
+
+    :return: The size of the file in bytes.
+    """
+    size = 0
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        for data in png_chunks(canvas, rows_per_block, level):
+            f.write(data)
+            size += len(data)
+    os.replace(partial, path)
+    if DEBUG:
+        print(f"[PNG] Wrote {path} ({size} bytes)")
+    return size
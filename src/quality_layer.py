@@ -0,0 +1,69 @@
+import os
+from functools import lru_cache
+import numpy as np
+from canvas_store import CANVAS_FILE, MAP_WIDTH, MAP_HEIGHT
+
+DEBUG = False
+
+LENS_RANK = {600: 3, 800: 2, 1000: 1} # Footprint side -> rank, the narrow lens puts the most detail in a map pixel
+CENTER_LEVELS = 64 # Quality steps from the edge to the center of a photo (3 * 64 + 63 = 255 fits a uint8)
+GOOD_QUALITY = CENTER_LEVELS # Good enough for coverage: any lens, as the commander marks the photos of every lens (2 * CENTER_LEVELS: normal lens or better)
+
+
+def quality_file(canvas_path=CANVAS_FILE):
+    """
+    Returns the path of the quality layer of a raw canvas (next to it).
+    """
+    return os.path.splitext(canvas_path)[0] + ".quality"
+
+
+QUALITY_FILE = quality_file()
+
+
+def open_quality(path=QUALITY_FILE, mode='r', width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Opens the quality layer of the canvas as a (height, width) uint8 memmap, 0 where nothing is stitched.
+
+    :param path: Path of the quality file.
+    :param mode: 'r' for read-only, 'r+' for read/write (the file is created empty if it does not exist).
+    """
+    if mode != 'r' and not os.path.exists(path):
+        mode = 'w+'
+    return np.memmap(path, dtype=np.uint8, mode=mode, shape=(height, width))
+
+
+@lru_cache(maxsize=8)
+def photo_quality(h, w):
+    """
+    Returns the quality of every pixel of a h x w photo: its lens rank times CENTER_LEVELS, plus how close the
+    pixel is to the center of the photo (the borders are the most distorted and the most off-nadir).
+    The array is cached and read-only.
+    """
+    rank = LENS_RANK.get(max(h, w), 1)
+    ys = np.abs(np.arange(h) - (h - 1) / 2) / (h / 2)
+    xs = np.abs(np.arange(w) - (w - 1) / 2) / (w / 2)
+    offset = np.maximum.outer(ys, xs) # 0 at the center, < 1 at the border
+    quality = (rank * CENTER_LEVELS + np.floor((1 - offset) * (CENTER_LEVELS - 1))).astype(np.uint8)
+    quality.flags.writeable = False
+    return quality
+
+
+def paste_best(canvas_view, quality_view, img, img_quality):
+    """
+    Copies the pixels of an image onto the canvas only where they are strictly better than what is already there.
+
+    :param canvas_view: (h, w, 3) view of the canvas.
+    :param quality_view: (h, w) view of the quality layer at the same place.
+    :param img: (h, w, 3) image.
+    :param img_quality: (h, w) quality of the image pixels.
+    :return: The number of pixels written.
+    """
+    better = img_quality > quality_view
+    written = int(np.count_nonzero(better))
+    if written == better.size:
+        canvas_view[...] = img
+        quality_view[...] = img_quality
+    elif written:
+        np.copyto(canvas_view, img, where=better[..., None])
+        np.copyto(quality_view, img_quality, where=better)
+    return written
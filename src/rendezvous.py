@@ -0,0 +1,308 @@
+import math
+from fractions import Fraction
+import numpy as np
+
+DEBUG = False
+
+MAP_WIDTH = 21600
+MAP_HEIGHT = 10800
+HORIZON = 100 # Number of wrap periods (per axis) searched, same bound as the old interval enumeration
+
+
+def mod_signed_diff(a, b, mod_val):
+    """
+    Returns the signed minimal difference between a and b on a circle of circumference mod_val.
+    The result lies in [-mod_val/2, mod_val/2].
+    :param a: First value
+    :param b: Second value
+    :param mod_val: Modulus value (circumference of the circle)
+    """
+    diff = (a - b) % mod_val
+    if diff > mod_val/2:
+        diff -= mod_val
+    return diff
+
+
+def _exact(value):
+    """
+    Converts a telemetry number to an exact fraction (10.43 -> 1043/100, not the binary float).
+    """
+    return Fraction(repr(float(value)))
+
+
+def _first_multiple_in_range(a, m, low, high):
+    """
+    Smallest n >= 0 such that low <= (a * n) mod m <= high, with 0 <= low <= high < m, or None.
+    Euclid-like recursion on (a, m): O(log m) steps.
+    """
+    a %= m
+    if low == 0:
+        return 0
+    if a == 0:
+        return None
+    n = -(-low // a)
+    if a * n <= high:
+        return n
+    # No multiple of a lies in [low, high]: look for the smallest k such that a*n - m*k lands in it,
+    # i.e. (m * k) mod a in [(-high) mod a, (-low) mod a]
+    k = _first_multiple_in_range(m % a, a, (-high) % a, (-low) % a)
+    if k is None:
+        return None
+    return -(-(low + m * k) // a)
+
+
+def first_in_range(a, b, m, low, high):
+    """
+    Smallest n >= 0 such that (a * n + b) mod m lies in the circular range [low, high] (integers), or None.
+    """
+    low = (low - b) % m
+    high = (high - b) % m
+    if low > high: # The shifted range wraps over 0, so n = 0 already fits
+        return 0
+    return _first_multiple_in_range(a, m, low, high)
+
+
+class Rendezvous:
+    '''
+    Exact solver for "when does melvin, drifting at constant (vx, vy) on the toroidal map, pass within
+    tolerance of a destination?".
+
+    The x coordinate crosses dest_x at t_n = (a + n * width) / vx for n = 0, 1, 2... and stays within tolerance
+    for tolerance / vx seconds around it. At t_n the y error is e_n = (c + n * width * vy / vx) mod height, and
+    the x and y windows overlap iff |e_n| <= tolerance * (1 + vy / vx). Scaled to integers this is a single
+    "smallest n with (A n + B) mod M in [L, R]" problem, solved in O(log) steps without enumerating the wraps.
+    The shared fractions are computed once per velocity, so many destinations can be evaluated cheaply.
+    '''
+    def __init__(self, vx, vy, width=MAP_WIDTH, height=MAP_HEIGHT, tolerance=2):
+        """
+        :param vx: Velocity in x-direction
+        :param vy: Velocity in y-direction
+        :param width: Width of the map (wrap-around)
+        :param height: Height of the map (wrap-around)
+        :param tolerance: Tolerance for reaching the destination
+        """
+        self.width = width
+        self.height = height
+        self.tolerance = _exact(tolerance)
+        # Negative velocities are mirrored so that both axes move forward
+        self.sign_x = -1 if vx < 0 else 1
+        self.sign_y = -1 if vy < 0 else 1
+        self.vx = abs(_exact(vx))
+        self.vy = abs(_exact(vy))
+
+        if self.vx != 0:
+            self.ratio = self.vy / self.vx
+            self.bound = self.tolerance * (1 + self.ratio) # Max |e_n| for the windows to overlap
+            self.step = width * self.ratio # y advance between two x crossings
+            self.x_margin = self.tolerance / self.vx # Half length of an x window in seconds
+
+    def _mirror(self, x, y, dest_x, dest_y):
+        return self.sign_x * x, self.sign_y * y, self.sign_x * dest_x, self.sign_y * dest_y
+
+    def _limit(self, x, y, dest_x, dest_y, horizon):
+        """
+        Time after which no window is searched (mirrored coordinates), None without horizon.
+        """
+        if horizon is None:
+            return None
+        # Same wrap counts as the old enumeration: crossings n_min..n_min + horizon, n_min = floor(d / period) - 1
+        limits = []
+        for position, dest, velocity, period in ((x, dest_x, self.vx, self.width), (y, dest_y, self.vy, self.height)):
+            if velocity != 0:
+                distance = _exact(dest - position)
+                last = (distance + (math.floor(distance / period) - 1 + horizon) * period) / velocity
+                limits.append(last + self.tolerance / velocity)
+        return min(limits) if limits else None
+
+    def windows(self, x, y, dest_x, dest_y, count=1, horizon=HORIZON):
+        """
+        Returns the first count time windows [start, end] (seconds from now) during which both coordinates are
+        within tolerance of the destination, in increasing order.
+
+        :param x: Current x-coordinate
+        :param y: Current y-coordinate
+        :param dest_x: Destination x-coordinate
+        :param dest_y: Destination y-coordinate
+        :param count: Number of windows to return.
+        :param horizon: Number of wrap periods searched on each axis, None for no limit.
+        """
+        x, y, dest_x, dest_y = self._mirror(x, y, dest_x, dest_y)
+        limit = self._limit(x, y, dest_x, dest_y, horizon)
+
+        if self.vx == 0 or self.vy == 0:
+            return self._windows_one_axis(x, y, dest_x, dest_y, count, limit)
+        return self._windows_two_axes(x, y, dest_x, dest_y, count, limit)
+
+    def _windows_two_axes(self, x, y, dest_x, dest_y, count, limit):
+        """
+        Windows when both axes move (mirrored coordinates), see windows.
+        """
+        tol = self.tolerance
+        a = _exact(dest_x - x) % self.width
+        c = _exact(y - dest_y) + self.ratio * a
+        # Integer problem: smallest n with (step * n + c + bound) mod height in [0, 2 * bound], everything scaled
+        scale = math.lcm(self.step.denominator, self.bound.denominator, c.denominator)
+        step = int(self.step * scale)
+        modulo = self.height * scale
+        offset = int((c + self.bound) * scale) % modulo
+        span = min(int(2 * self.bound * scale), modulo - 1)
+
+        result = []
+        n = 0
+        while len(result) < count:
+            found = first_in_range(step, offset + step * n, modulo, 0, span)
+            if found is None:
+                break
+            n += found
+            crossing = (a + n * self.width) / self.vx
+            x_start = max(crossing - self.x_margin, 0)
+            x_end = crossing + self.x_margin
+            # y error when x enters its window, then first time y is within tolerance from there
+            error = mod_signed_diff(c + n * self.step - self.vy * (crossing - x_start), 0, self.height)
+            if abs(error) <= tol:
+                start = x_start
+            else:
+                start = x_start + ((-tol - error) % self.height) / self.vy
+                error = -tol
+            end = min(x_end, start + (tol - error) / self.vy)
+            if limit is not None and start > limit:
+                break
+            if start <= end:
+                result.append((float(start), float(end)))
+            n += 1
+        return result
+
+    def _windows_one_axis(self, x, y, dest_x, dest_y, count, limit):
+        """
+        Windows when at least one axis does not move: that axis must already be within tolerance.
+        """
+        for position, dest, velocity, period in ((x, dest_x, self.vx, self.width), (y, dest_y, self.vy, self.height)):
+            if velocity == 0 and abs(mod_signed_diff(position, dest, period)) > self.tolerance:
+                return []
+        moving = [(position, dest, velocity, period) for position, dest, velocity, period in ((x, dest_x, self.vx, self.width), (y, dest_y, self.vy, self.height)) if velocity != 0]
+        if not moving:
+            return [(0.0, float('inf'))][:count]
+
+        position, dest, velocity, period = moving[0]
+        distance = _exact(dest - position) % period
+        result = []
+        for n in range(count):
+            crossing = (distance + n * period) / velocity
+            start = max(crossing - self.tolerance / velocity, 0)
+            if limit is not None and start > limit:
+                break
+            result.append((float(start), float(crossing + self.tolerance / velocity)))
+        return result
+
+    def min_tolerance(self, x, y, dest_x, dest_y, horizon=HORIZON):
+        """
+        Smallest tolerance for which melvin passes the destination within the horizon: the smallest y error e_n
+        over the x crossings, |e_n| / (1 + vy / vx), all evaluated at once.
+
+        :return: The tolerance in pixels (float), inf if a motionless axis never gets there.
+        """
+        x, y, dest_x, dest_y = self._mirror(x, y, dest_x, dest_y)
+        if self.vx == 0 or self.vy == 0:
+            # The moving axis passes everywhere, a motionless one must already be there
+            return float(max([abs(mod_signed_diff(position, dest, period)) for position, dest, velocity, period
+                              in ((x, dest_x, self.vx, self.width), (y, dest_y, self.vy, self.height)) if velocity == 0]))
+
+        a = _exact(dest_x - x) % self.width
+        c = _exact(y - dest_y) + self.ratio * a
+        limit = self._limit(x, y, dest_x, dest_y, horizon)
+        if limit is not None:
+            # Crossings whose window opens before the horizon
+            crossings = max(math.floor(((limit + self.tolerance / self.vx) * self.vx - a) / self.width) + 1, 1)
+        else:
+            crossings = self.height * self.step.denominator # The errors repeat after that many crossings
+        errors = (float(c) + np.arange(crossings) * float(self.step) + self.height / 2) % self.height - self.height / 2
+        return float(np.abs(errors).min() / (1 + float(self.vy / self.vx)))
+
+    def earliest(self, x, y, dest_x, dest_y, horizon=HORIZON):
+        """
+        Earliest time (seconds, float) when melvin is within tolerance of the destination, inf if never.
+        """
+        found = self.windows(x, y, dest_x, dest_y, 1, horizon)
+        if not found:
+            return float('inf')
+        return found[0][0]
+
+    def earliest_many(self, x, y, dest_xs, dest_ys, horizon=HORIZON):
+        """
+        Earliest times (see earliest) from one position to many destinations. The fractions of the velocity are
+        shared by all of them and the position is mirrored once, so each destination only solves its own modular
+        problem.
+
+        :param dest_xs: X-coordinates of the destinations.
+        :param dest_ys: Y-coordinates of the destinations.
+        :return: A float array with one time per destination, inf where never.
+        """
+        x, y = self.sign_x * x, self.sign_y * y
+        windows = self._windows_one_axis if self.vx == 0 or self.vy == 0 else self._windows_two_axes
+        times = np.full(len(dest_xs), np.inf)
+        for i, (dest_x, dest_y) in enumerate(zip(dest_xs, dest_ys)):
+            dest_x, dest_y = self.sign_x * dest_x, self.sign_y * dest_y
+            found = windows(x, y, dest_x, dest_y, 1, self._limit(x, y, dest_x, dest_y, horizon))
+            if found:
+                times[i] = found[0][0]
+        return times
+
+
+def hit_windows(x, y, vx, vy, dest_x, dest_y, count=10, width=MAP_WIDTH, height=MAP_HEIGHT, tolerance=2, horizon=HORIZON):
+    """
+    Returns the next count time windows [start, end] (in seconds) during which melvin, at constant velocity,
+    is within tolerance of (dest_x, dest_y). See Rendezvous.windows.
+    """
+    return Rendezvous(vx, vy, width, height, tolerance).windows(x, y, dest_x, dest_y, count, horizon)
+
+
+def calculate_travel_time(x, y, vx, vy, dest_x, dest_y, width=MAP_WIDTH, height=MAP_HEIGHT, tolerance=2, horizon=HORIZON):
+    """
+    Calculates the time (in seconds) required to reach (dest_x, dest_y) from (x, y)
+    with constant velocities (vx, vy) in a wrap-around world (toroidal map).
+    It returns the first time t >= 0 such that both:
+
+        |mod(x + vx*t - dest_x, width)| <= tolerance
+        |mod(y + vy*t - dest_y, height)| <= tolerance
+
+    solved with modular arithmetic in O(log) steps instead of enumerating the wrap intervals.
+    If one of the velocity components is zero and the corresponding coordinate
+    is not already within tolerance, the destination is unreachable (returns infinity).
+    :param x: Current x-coordinate
+    :param y: Current y-coordinate
+    :param vx: Velocity in x-direction
+    :param vy: Velocity in y-direction
+    :param dest_x: Destination x-coordinate
+    :param dest_y: Destination y-coordinate
+    :param width: Width of the map (wrap-around)
+    :param height: Height of the map (wrap-around)
+    :param tolerance: Tolerance for reaching the destination
+    :param horizon: Number of wrap periods searched on each axis (100 like the old enumeration), None for no limit
+    """
+    candidate_time = Rendezvous(vx, vy, width, height, tolerance).earliest(x, y, dest_x, dest_y, horizon)
+    if candidate_time == float('inf'):
+        return float('inf')
+    # Return the time rounded to the nearest integer second.
+    return int(round(candidate_time))
+
+
+def smallest_tolerance(x, y, vx, vy, dest_x, dest_y, low=20, high=100, step=5, width=MAP_WIDTH, height=MAP_HEIGHT, horizon=HORIZON):
+    """
+    Finds the smallest tolerance of the grid low, low + step, ..., high for which the destination is reached
+    (see Rendezvous.min_tolerance), and the travel time with it, without trying every tolerance in turn.
+
+    :return: (tolerance, travel time in seconds), (None, inf) if no tolerance of the grid works.
+    """
+    # The horizon of the largest tolerance covers the windows of all the smaller ones
+    needed = Rendezvous(vx, vy, width, height, high).min_tolerance(x, y, dest_x, dest_y, horizon)
+    if math.isinf(needed):
+        return None, float('inf')
+    tolerance = low + step * max(math.ceil((needed - low) / step), 0)
+    if tolerance - step >= low and needed <= tolerance - step + 1e-6: # Rounding of the float errors
+        tolerance -= step
+    while tolerance <= high:
+        travel_time = calculate_travel_time(x, y, vx, vy, dest_x, dest_y, width, height, tolerance, horizon)
+        if not math.isinf(travel_time):
+            return tolerance, travel_time
+        tolerance += step # Only on a float rounding at the boundary of a step
+    return None, float('inf')
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+DEBUG = False
+
+
+class Runtime:
+    '''
+    An asyncio event loop running in a daemon thread next to the (blocking) commander logic.
+
+    Background work (telemetry polling, the announcements stream, objective polling) runs as tasks of this loop
+    instead of ad-hoc threads sleeping on their own. Whenever a task learns something the commander must react to
+    (a beacon message, a ping, a new objective) it calls notify(), which wakes up every sleep() of the commander
+    at once instead of on its next sleep tick.
+    '''
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._wakeup = threading.Condition()
+        self.generation = 0 # Increased by every notify()
+
+    def start(self):
+        """
+        Starts the event loop thread (once).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="runtime")
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        self.loop.run_forever()
+
+    def spawn(self, coroutine):
+        """
+        Schedules a coroutine as a task of the loop.
+
+        :return: A concurrent.futures.Future of its result.
+        """
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self._report)
+        return future
+
+    def spawn_blocking(self, func, *args):
+        """
+        Runs a blocking function (e.g. a stream consumer) as a task, inside the default executor of the loop.
+        """
+        return self.spawn(asyncio.to_thread(func, *args))
+
+    def every(self, interval, func, *args):
+        """
+        Calls a blocking function every interval seconds, as a task of the loop.
+        If it returns a number, that number replaces the interval for the next call.
+        """
+        async def periodic():
+            while True:
+                delay = await asyncio.to_thread(func, *args)
+                await asyncio.sleep(interval if delay is None else delay)
+        return self.spawn(periodic())
+
+    @staticmethod
+    def _report(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[RUNTIME ERROR] Background task failed: {future.exception()}")
+
+    def notify(self):
+        """
+        Wakes up every sleep() so that the interrupt checks run immediately.
+        """
+        with self._wakeup:
+            self.generation += 1
+            self._wakeup.notify_all()
+
+    def sleep(self, seconds, until=None):
+        """
+        Sleeps for the given seconds, or less if the until predicate becomes true.
+        The predicate is evaluated at start and after every notify(), never by polling.
+
+        :param seconds: Maximum seconds to sleep.
+        :param until: Callable without arguments, None for a plain (but still notify-aware) sleep.
+        :return: True if the sleep was interrupted by the predicate.
+        """
+        deadline = time.monotonic() + max(seconds, 0)
+        with self._wakeup:
+            while True:
+                if until is not None and until():
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._wakeup.wait(remaining)
+
+
+RUNTIME = Runtime()
+
+
+def interruptible_sleep(seconds, until=None):
+    """
+    Sleeps on the shared runtime, see Runtime.sleep.
+    """
+    return RUNTIME.sleep(seconds, until)
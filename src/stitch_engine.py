@@ -0,0 +1,160 @@
+import math
+import multiprocessing
+import os
+import cv2
+from canvas_store import open_canvas, CANVAS_FILE, MAP_WIDTH, MAP_HEIGHT
+from photo_pipeline import footprint_size, resize_plan
+from quality_layer import open_quality, quality_file, photo_quality
+from toroidal_paste import row_runs, wrapped_rects, paste
+
+DEBUG = False
+
+MAX_WORKERS = 8 # More bands than this only adds routing overhead on a 10800 rows canvas
+INBOX_SIZE = 64 # Jobs waiting per band worker before submit() blocks
+
+
+def _band_worker(canvas_path, quality_path, width, height, band_start, band_end, inbox):
+    """
+    Owns the rows [band_start, band_end) of the canvas: only this process writes them, so no locking is needed.
+    Jobs are (x, canvas_y, image_row, rows, pixels or path, (h, w) of the whole image).
+    """
+    canvas = open_canvas(canvas_path, 'r+', width, height)
+    quality = open_quality(quality_path, 'r+', width, height) if quality_path else None
+    cached_path, cached_img = None, None
+    while True:
+        job = inbox.get()
+        try:
+            if job is None:
+                break
+            x, canvas_y, image_row, count, source, shape = job
+            if isinstance(source, str):
+                # Offline rebuilds send the path: the worker decodes, the router never touches pixels
+                if source != cached_path:
+                    cached_img = cv2.imread(source)
+                    if cached_img is not None and shape[0] == shape[1]:
+                        plan = resize_plan(shape[0])
+                        cached_img = plan.resize(cached_img, plan.buffer()) # Reused until the next path
+                    elif cached_img is not None and cached_img.shape[:2] != shape:
+                        cached_img = cv2.resize(cached_img, (shape[1], shape[0]))
+                    cached_path = source
+                img = cached_img
+                if img is None:
+                    print(f"[STITCH ENGINE] Could not read {source}")
+                    continue
+                rows = img[image_row:image_row + count]
+            else:
+                rows = source
+            rows_quality = photo_quality(*shape)[image_row:image_row + count] if quality is not None else None
+            strip = slice(canvas_y, canvas_y + count) # The rows are inside the band, only the columns can wrap
+            paste(canvas[strip], rows, x, 0, quality=None if quality is None else quality[strip], img_quality=rows_quality)
+        except Exception as e:
+            print(f"[STITCH ENGINE ERROR] Band {band_start}-{band_end}: {str(e)}")
+        finally:
+            inbox.task_done()
+    canvas.flush()
+    if quality is not None:
+        quality.flush()
+
+
+class StitchEngine:
+    '''
+    Parallel stitcher for the on-disk canvas.
+
+    The canvas is split into horizontal bands, each owned by one worker process that writes it through its own
+    memmap of the canvas file. Every image is routed to the bands it overlaps (rows and columns wrap around the
+    map), so different bands are written in parallel while the images of a band keep their submission order.
+    With the quality layer, a pixel is only overwritten by a better one (narrower lens, closer to the center of
+    its photo) instead of by the most recent photo.
+    '''
+    def __init__(self, canvas_path=CANVAS_FILE, workers=None, width=MAP_WIDTH, height=MAP_HEIGHT, quality=True):
+        """
+        :param canvas_path: Raw canvas file (created black if missing).
+        :param workers: Number of band workers, one per core (up to MAX_WORKERS) by default.
+        :param width: Width of the map in pixels.
+        :param height: Height of the map in pixels.
+        :param quality: Keep the quality layer of the canvas (see quality_layer), False to always overwrite.
+        """
+        if workers is None:
+            workers = min(os.cpu_count() or 1, MAX_WORKERS)
+        self.width = width
+        self.height = height
+        open_canvas(canvas_path, 'r+', width, height).flush() # Create the files once, before the workers open them
+        self.quality_path = quality_file(canvas_path) if quality else None
+        if self.quality_path:
+            open_quality(self.quality_path, 'r+', width, height).flush()
+
+        band = math.ceil(height / workers)
+        self.bands = [(start, min(start + band, height)) for start in range(0, height, band)]
+        self.inboxes = []
+        self.processes = []
+        for band_start, band_end in self.bands:
+            inbox = multiprocessing.JoinableQueue(INBOX_SIZE)
+            process = multiprocessing.Process(target=_band_worker, args=(canvas_path, self.quality_path, width, height, band_start, band_end, inbox), daemon=True)
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        self.submitted = 0
+
+    def _route(self, x, y, w, h, source_rows, source):
+        """
+        Sends the rows of an image to the bands they overlap.
+
+        :return: The wrapped_rects covered by the image, for dirty tracking.
+        """
+        for canvas_y, image_row, count in row_runs(y, h, self.height):
+            for index, (band_start, band_end) in enumerate(self.bands):
+                start = max(canvas_y, band_start)
+                end = min(canvas_y + count, band_end)
+                if start >= end:
+                    continue
+                offset = image_row + start - canvas_y
+                payload = source_rows(offset, end - start) if source is None else source
+                self.inboxes[index].put((x, start, offset, end - start, payload, (h, w)))
+        self.submitted += 1
+        return wrapped_rects(x, y, w, h, self.width, self.height)
+
+    def submit(self, img, x, y):
+        """
+        Stitches a decoded image with its top left corner at (x, y).
+
+        :return: The wrapped_rects covered by the image.
+        """
+        return self._route(x, y, img.shape[1], img.shape[0], lambda offset, count: img[offset:offset + count], None)
+
+    def submit_file(self, path, x, y, size=None):
+        """
+        Stitches an image file with its top left corner at (x, y). The band workers read and decode it.
+
+        :param size: Side of the footprint, taken from the lens in the file name by default.
+        """
+        if size is None:
+            size = footprint_size(path)
+        return self._route(x, y, size, size, None, path)
+
+    def __getstate__(self):
+        # Handed to the live stitching process: it routes images and joins, the creator owns the workers
+        state = self.__dict__.copy()
+        state["processes"] = []
+        return state
+
+    def join(self):
+        """
+        Waits until every submitted image is on the canvas.
+        """
+        for inbox in self.inboxes:
+            inbox.join()
+
+    def close(self):
+        """
+        Finishes the pending images and stops the workers (creator only).
+        """
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
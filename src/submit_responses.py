@@ -1,6 +1,8 @@
-import requests
-import re
 import json
+import uuid
+import melvin_client
+from canvas_store import open_canvas, CANVAS_FILE
+from png_stream import png_chunks
 
 DEBUG = False
 
@@ -12,6 +14,58 @@ BEACON_URL = f"{MELVIN_BASE_URL}/beacon" # PUT method
 IMAGE_URL = f"{MELVIN_BASE_URL}/image" # POST method
 DAILYMAP_URL = f"{MELVIN_BASE_URL}/dailyMap" # POST method
 
+UPLOAD_BLOCK = 1 << 20 # Bytes read at once when streaming a file to melvin
+
+
+''' Multipart/form-data body streamed from an iterable of bytes (sent chunked, never assembled in memory)
+@params
+field: name of the form field
+filename: name of the file sent
+content_type: MIME type of the file
+chunks: iterable of the bytes of the file
+'''
+def multipart_stream(field, filename, content_type, chunks):
+    boundary = uuid.uuid4().hex
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    def body():
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+               f'Content-Type: {content_type}\r\n\r\n').encode()
+        yield from chunks
+        yield f'\r\n--{boundary}--\r\n'.encode()
+
+    return headers, body()
+
+
+''' Bytes of a file, one UPLOAD_BLOCK at a time
+@params
+path: path of the file
+'''
+def read_blocks(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(UPLOAD_BLOCK)
+            if not block:
+                return
+            yield block
+
+
+''' Posting a streamed daily map
+@params
+chunks: iterable of the bytes of the PNG
+'''
+def post_map(chunks):
+    headers, body = multipart_stream("image", "total_map", "image/png", chunks)
+    response = melvin_client.post(DAILYMAP_URL, data=body, headers=headers)
+
+    if response.status_code == 200:
+        result = response.json()
+        if DEBUG:
+            print(f"[INFO] Daily Map submitted: {result}")
+        return result
+    else:
+        raise Exception(f"Failed to submit daily map: {response.text}")
+
 
 ''' Submitting Image objective zoned/secret 
 @params
@@ -33,7 +87,7 @@ def submit_image(obj_id, path):
     }
 
     # Send the POST request
-    response = requests.post(IMAGE_URL, params=params, files=files)
+    response = melvin_client.post(IMAGE_URL, params=params, files=files)
 
     if response.status_code == 200:
         result = response.json()
@@ -44,26 +98,20 @@ def submit_image(obj_id, path):
         raise Exception(f"Failed to submit objective image: {response.text}")
 
 
-''' Submitting Daily Map 
+''' Submitting Daily Map (streamed from disk)
 @params
 total_map: stiched map ready for submition 
 '''
 def submit_map(total_map):
-    with open(total_map, "rb") as image_file:
-        image_binary = image_file.read()
+    return post_map(read_blocks(total_map))
 
-    files = {
-        "image": ("total_map", image_binary, "image/png")
-    }
-    response = requests.post(DAILYMAP_URL, files=files)
 
-    if response.status_code == 200:
-        result = response.json()
-        if DEBUG:
-            print(f"[INFO] Daily Map submitted: {result}")
-        return result
-    else:
-        raise Exception(f"Failed to submit daily map: {response.text}")
+''' Submitting Daily Map straight from the on-disk canvas of the stitching process
+@params
+canvas_path: raw canvas file (opened read-only, encoded block by block while it is uploaded)
+'''
+def submit_map_from_canvas(canvas_path=CANVAS_FILE):
+    return post_map(png_chunks(open_canvas(canvas_path, 'r')))
 
 
 ''' Submitting EB position estimation 
@@ -82,7 +130,7 @@ def submit_EB(id, x, y):
         "width": x,
         "height": y
     }
-    response = requests.put(BEACON_URL, params=params)
+    response = melvin_client.put(BEACON_URL, params=params)
 
     if response.status_code == 200:
         result = response.json()
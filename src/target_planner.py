@@ -0,0 +1,132 @@
+import math
+import numpy as np
+from vel_calculation import calculate_velocity
+from rendezvous import Rendezvous
+
+DEBUG = False
+
+MAP_WIDTH = 21600
+MAP_HEIGHT = 10800
+
+A_CONST = 0.02 # Velocity change per second while accelerating in acquisition mode
+FUEL_LOSS = 0.03 # Fuel burnt per unit of velocity change
+ACQUISITION_BATTERY_LOSS = 0.15 # Battery loss per second in acquisition mode
+CHARGE_TIME_PER_BATTERY = 10 # Seconds of charge mode needed to win back 1% of battery
+FUEL_PENALTY = 60 # Seconds a unit of fuel is worth when ranking targets
+SHORTLIST = 40 # Number of candidates refined with calculate_velocity
+
+
+def toroidal_distance(x1, y1, x2, y2, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Shortest distance between two points (or arrays of points) on the wrapped map.
+    """
+    dx = np.abs(np.asarray(x2) - x1) % width
+    dy = np.abs(np.asarray(y2) - y1) % height
+    return np.hypot(np.minimum(dx, width - dx), np.minimum(dy, height - dy))
+
+
+def maneuver_cost(vx, vy, new_vx, new_vy):
+    """
+    Estimates the cost of changing the velocity of melvin from (vx, vy) to (new_vx, new_vy).
+
+    :return: (time in seconds, fuel, battery) spent accelerating.
+    """
+    dv = math.hypot(new_vx - vx, new_vy - vy)
+    seconds = dv / A_CONST
+    return seconds, dv * FUEL_LOSS, seconds * ACQUISITION_BATTERY_LOSS
+
+
+def plan_targets(grid, observation, window=1000, step=500, min_vacant=1, shortlist=SHORTLIST, tolerance=None):
+    """
+    Ranks every candidate window of the coverage grid by uncovered pixels reached per second of effort.
+
+    All the windows are scored at once from the summed-area table of the grid, the best ones by
+    vacancy over straight line distance are shortlisted, and only those are refined with
+    calculate_velocity, the travel time and the fuel/battery cost of the velocity change. The travel times
+    of the candidates sharing a velocity are solved together (see Rendezvous.earliest_many).
+
+    :param grid: CoverageGrid of the daily map.
+    :param observation: Latest observation of melvin (width_x, height_y, vx, vy, fuel and battery are used).
+    :param window: Side of the candidate windows in pixels.
+    :param step: Distance between two candidate points in pixels.
+    :param min_vacant: Candidates with fewer uncovered pixels are ignored.
+    :param shortlist: Number of candidates refined with calculate_velocity.
+    :param tolerance: Distance to a target counting as reached, for the exact travel time of the wrapping drift
+                      (see rendezvous). None for the straight line distance over the speed.
+    :return: A list of candidate dicts sorted from the best to the worst score.
+    """
+    x, y = observation["width_x"], observation["height_y"]
+    vx, vy = observation["vx"], observation["vy"]
+    speed = max(math.hypot(vx, vy), 1e-6)
+
+    xs, ys, vacancies = grid.rank_windows(window, step)
+    keep = vacancies >= min_vacant
+    xs, ys, vacancies = xs[keep], ys[keep], vacancies[keep]
+    if len(xs) == 0:
+        return []
+
+    # Cheap estimate to shortlist: uncovered pixels per second of straight line flight at the current speed
+    estimate = vacancies / (toroidal_distance(x, y, xs, ys, grid.width, grid.height) / speed + 1)
+    best = np.argsort(-estimate, kind='stable')[:shortlist]
+
+    candidates = []
+    for k in best:
+        target_x, target_y, vacant = int(xs[k]), int(ys[k]), int(vacancies[k])
+        speed_change = calculate_velocity(x, y, target_x, target_y, vx, vy)
+        if not speed_change:
+            continue
+        new_vx, new_vy = speed_change["vx"], speed_change["vy"]
+
+        seconds, fuel, battery = maneuver_cost(vx, vy, new_vx, new_vy)
+        if fuel > observation.get("fuel", float('inf')):
+            continue
+        candidates.append({
+            "x": target_x,
+            "y": target_y,
+            "vacant": vacant,
+            "vx": new_vx,
+            "vy": new_vy,
+            "maneuver_time": seconds,
+            "travel_time": speed_change["distance"] / math.hypot(new_vx, new_vy),
+            "fuel": fuel,
+            "battery": battery,
+        })
+
+    if tolerance is not None:
+        by_velocity = {}
+        for candidate in candidates:
+            by_velocity.setdefault((candidate["vx"], candidate["vy"]), []).append(candidate)
+        for (new_vx, new_vy), group in by_velocity.items():
+            times = Rendezvous(new_vx, new_vy, grid.width, grid.height, tolerance).earliest_many(
+                x, y, [candidate["x"] for candidate in group], [candidate["y"] for candidate in group])
+            for candidate, transit in zip(group, times):
+                # Whole seconds, as calculate_travel_time
+                candidate["travel_time"] = round(transit) if math.isfinite(transit) else float('inf')
+
+    plan = []
+    for candidate in candidates:
+        if candidate["travel_time"] == float('inf'):
+            continue
+        cost = (candidate["maneuver_time"] + candidate["travel_time"] + FUEL_PENALTY * candidate["fuel"]
+                + CHARGE_TIME_PER_BATTERY * candidate["battery"])
+        candidate["score"] = candidate["vacant"] / max(cost, 1)
+        plan.append(candidate)
+
+    plan.sort(key=lambda candidate: candidate["score"], reverse=True)
+    if DEBUG and plan:
+        print(f"[PLANNER] Best target {plan[0]['x']},{plan[0]['y']} score {round(plan[0]['score'], 1)} out of {len(plan)} candidates")
+    return plan
+
+
+if __name__ == '__main__':
+    import time
+    from coverage_grid import CoverageGrid
+
+    grid = CoverageGrid()
+    grid.update_map(10000, 5000, "wide", 1)
+    observation = {"width_x": 10000, "height_y": 5000, "vx": 10, "vy": 6, "fuel": 100, "battery": 100}
+    start = time.time()
+    plan = plan_targets(grid, observation)
+    print(f"Planned {len(plan)} candidates in {round(time.time() - start, 3)} s")
+    for candidate in plan[:5]:
+        print(candidate)
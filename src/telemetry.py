@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+DEBUG = False
+
+TELEMETRY_INTERVAL = 0.5 # Seconds between two polls of /observation
+RETRY_DELAY = 1 # Seconds to wait after a failed poll
+
+
+class TelemetryCache:
+    '''
+    A single poller thread refreshes the observation of melvin at a fixed rate into a thread-safe snapshot.
+    Every thread of the process reads the latest snapshot (or waits for a newer one) instead of sending its own
+    request, so the link to melvin sees one request per interval whatever the number of readers.
+    '''
+    def __init__(self, fetch, interval=TELEMETRY_INTERVAL):
+        """
+        :param fetch: Callable returning the observation dict (raises on failure).
+        :param interval: Seconds between two polls.
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.snapshot = None
+        self.received = 0 # time.monotonic() of the latest snapshot
+        self.failures = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self.external = False # True once the polling runs as a task of a runtime
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """
+        Registers a callback called with every new observation, from the polling thread (keep it short).
+        """
+        self._subscribers.append(callback)
+
+    def attach(self, runtime):
+        """
+        Moves the polling from the dedicated thread to a periodic task of the given runtime.
+
+        :param runtime: runtime.Runtime instance.
+        """
+        with self._condition:
+            if self.external:
+                return
+            self.external = True
+            self.stop()
+        runtime.every(self.interval, self.tick)
+
+    def start(self):
+        """
+        Starts the poller thread if it is not running in this process (threads do not survive a fork).
+        """
+        with self._condition:
+            if self.external:
+                return
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="telemetry")
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops the poller thread.
+        """
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.tick())
+
+    def tick(self):
+        """
+        Polls once and returns the seconds to wait before the next poll.
+        """
+        return self.interval if self.poll() else RETRY_DELAY
+
+    def poll(self):
+        """
+        Fetches a new observation and publishes it.
+
+        :return: True on success.
+        """
+        try:
+            observation = self.fetch()
+        except Exception as e:
+            self.failures += 1
+            print(f"[ERROR] Failed to fetch observation data: {str(e)}")
+            return False
+        with self._condition:
+            self.snapshot = observation
+            self.received = time.monotonic()
+            self._condition.notify_all()
+        for callback in list(self._subscribers):
+            try:
+                callback(observation)
+            except Exception as e:
+                print(f"[ERROR] Telemetry subscriber failed: {str(e)}")
+        return True
+
+    def latest(self, max_age=None):
+        """
+        Returns the latest observation, waiting for the first one (or for one younger than max_age seconds).
+
+        :param max_age: Maximum age in seconds of the returned snapshot, None for any.
+        :return: The observation dict and the time.monotonic() it was received at.
+        """
+        self.start()
+        with self._condition:
+            while self.snapshot is None or (max_age is not None and time.monotonic() - self.received > max_age):
+                self._condition.wait(self.interval)
+            return self.snapshot, self.received
+
+    def wait_newer(self, after, timeout=None):
+        """
+        Waits for an observation received after the given time.
+
+        :param after: time.monotonic() value, e.g. the one returned by latest.
+        :param timeout: Maximum seconds to wait, None to wait forever.
+        :return: (observation, received) or (None, None) on timeout.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.snapshot is None or self.received <= after:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None, None
+                self._condition.wait(remaining)
+            return self.snapshot, self.received
@@ -0,0 +1,75 @@
+from quality_layer import paste_best
+
+DEBUG = False
+
+
+def row_runs(y, h, height):
+    """
+    Splits the rows [y, y + h) of an image wrapped around the map into contiguous runs.
+    Works the same on columns, with the width of the map.
+
+    :return: List of (canvas_y, image_row, rows), one or two runs.
+    """
+    y %= height
+    first = min(h, height - y)
+    runs = [(y, 0, first)]
+    if first < h:
+        runs.append((0, first, h - first))
+    return runs
+
+
+def clipped_run(y, h, height):
+    """
+    Clips the rows [y, y + h) of an image to the canvas, as row_runs does without wrapping.
+
+    :return: List of (canvas_y, image_row, rows), empty if the image is outside.
+    """
+    start, end = max(y, 0), min(y + h, height)
+    return [(start, start - y, end - start)] if start < end else []
+
+
+def blocks(x, y, w, h, width, height, wrap=True):
+    """
+    Splits the footprint of a w x h image with its top left corner at (x, y) into contiguous blocks of the canvas.
+
+    :param wrap: True for the map (a torus: up to 4 blocks), False to clip to the canvas (0 or 1 block).
+    :return: List of (canvas_x, canvas_y, image_x, image_y, w, h).
+    """
+    split = row_runs if wrap else clipped_run
+    return [(canvas_x, canvas_y, image_x, image_y, columns, rows)
+            for canvas_y, image_y, rows in split(y, h, height)
+            for canvas_x, image_x, columns in split(x, w, width)]
+
+
+def wrapped_rects(x, y, w, h, width, height):
+    """
+    Returns the (x, y, w, h) rectangles (up to 4) covered on the map by an image with its top left corner at (x, y).
+    """
+    return [(canvas_x, canvas_y, columns, rows) for canvas_x, canvas_y, _, _, columns, rows in blocks(x, y, w, h, width, height)]
+
+
+def paste(canvas, img, x, y, wrap=True, quality=None, img_quality=None):
+    """
+    Pastes an image with its top left corner at (x, y), with one slice copy per block (see blocks).
+    The parts crossing an edge of the map come back on the other side, so every pixel of the photo is kept.
+
+    :param canvas: (height, width, 3) canvas (array or memmap).
+    :param img: (h, w, 3) image.
+    :param wrap: True to wrap around the map, False to clip (e.g. the canvas of a zone).
+    :param quality: Quality layer of the canvas, None to overwrite (see quality_layer.paste_best).
+    :param img_quality: (h, w) quality of the image pixels, with a quality layer.
+    :return: The (x, y, w, h) rectangles where pixels were written, for dirty tracking.
+    """
+    height, width = canvas.shape[:2]
+    h, w = img.shape[:2]
+    written = []
+    for canvas_x, canvas_y, image_x, image_y, columns, rows in blocks(x, y, w, h, width, height, wrap):
+        view = canvas[canvas_y:canvas_y + rows, canvas_x:canvas_x + columns]
+        piece = img[image_y:image_y + rows, image_x:image_x + columns]
+        if quality is None:
+            view[...] = piece
+        elif not paste_best(view, quality[canvas_y:canvas_y + rows, canvas_x:canvas_x + columns], piece,
+                            img_quality[image_y:image_y + rows, image_x:image_x + columns]):
+            continue
+        written.append((canvas_x, canvas_y, columns, rows))
+    return written
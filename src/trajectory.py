@@ -0,0 +1,70 @@
+from functools import lru_cache
+import numpy as np
+
+DEBUG = False
+
+MAP_WIDTH = 21600
+MAP_HEIGHT = 10800
+VELOCITY_QUANTUM = 0.01 # Telemetry gives velocities with 2 decimals, so footprints are shared at this resolution
+FOOTPRINT_CACHE_SIZE = 64
+
+
+def orbit_steps(vx, vy, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Number of one second steps needed to wrap around the map once on the slowest axis.
+    """
+    return max(round(width / vx), round(height / vy))
+
+
+@lru_cache(maxsize=FOOTPRINT_CACHE_SIZE)
+def _footprint(qvx, qvy, steps, width, height):
+    offsets = np.arange(1, steps + 1, dtype=np.float64)
+    dx = offsets * (qvx * VELOCITY_QUANTUM)
+    dy = offsets * (qvy * VELOCITY_QUANTUM)
+    dx.setflags(write=False)
+    dy.setflags(write=False)
+    return dx, dy
+
+
+def orbit_footprint(vx, vy, steps=None, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Returns the displacements (dx, dy) of melvin after 1, 2, ... steps seconds at velocity (vx, vy).
+    The footprint does not depend on the starting point, so it is cached by quantized velocity
+    and every "is my orbit still useful?" check reuses it instead of simulating again.
+
+    :return: Two read-only float arrays.
+    """
+    qvx = int(round(vx / VELOCITY_QUANTUM))
+    qvy = int(round(vy / VELOCITY_QUANTUM))
+    if steps is None:
+        steps = orbit_steps(qvx * VELOCITY_QUANTUM, qvy * VELOCITY_QUANTUM, width, height)
+    return _footprint(qvx, qvy, steps, width, height)
+
+
+def ground_track(x, y, vx, vy, steps=None, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Returns the integer positions melvin passes through during the next steps seconds, wrapped around the map.
+
+    :param x: Current x-coordinate
+    :param y: Current y-coordinate
+    :param vx: Velocity in x-direction
+    :param vy: Velocity in y-direction
+    :param steps: Number of seconds to simulate, one full wrap of the slowest axis by default.
+    :return: (xs, ys) int arrays, one entry per second.
+    """
+    dx, dy = orbit_footprint(vx, vy, steps, width, height)
+    xs = np.rint(x + dx).astype(np.int64) % width
+    ys = np.rint(y + dy).astype(np.int64) % height
+    return xs, ys
+
+
+if __name__ == '__main__':
+    import time
+
+    start = time.time()
+    xs, ys = ground_track(100, 200, 10.43, 5.22)
+    print(f"First track of {len(xs)} points in {round(time.time() - start, 4)} s")
+    start = time.time()
+    xs, ys = ground_track(5000, 3000, 10.43, 5.22)
+    print(f"Cached track of {len(xs)} points in {round(time.time() - start, 4)} s")
+    print(list(zip(xs[:5], ys[:5])))
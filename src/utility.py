@@ -1,5 +1,8 @@
-import requests
 import time
+import melvin_client
+from telemetry import TelemetryCache
+from mode_transition import ModeTransitionManager, TRANSITION_STATE
+from photo_pipeline import ARCHIVE, RECENT
 
 DEBUG = False
 
@@ -18,15 +21,18 @@ precision: 1 for "wide",
 '''
 PHOTO_FOLDER = "images"  # Folder to save images
 
-def take_photo(): 
-    """Capture an image and save it with coordinates as the name."""
+def capture_photo():
+    """Capture an image, archive it in the background and return its name with its bytes."""
     if DEBUG:
         simulation(False,1)
     time.sleep(0.5)
-    response = requests.get(f"{MELVIN_BASE_URL}/image")
+    requested = time.monotonic()
+    response = melvin_client.get("/image")
     response.raise_for_status()
 
-    save = get_observation()
+    # Position of the photo: the first snapshot polled after the request, never one cached from before it
+    save, _ = TELEMETRY.wait_newer(requested, OBSERVATION_MAX_AGE)
+    save = dict(save) if save is not None else get_observation()
     lens_to_precision = {'wide': '1', 'normal': '8', 'narrow': '6'}
     if DEBUG:
         simulation(False,20)
@@ -36,12 +42,15 @@ def take_photo():
 
     # images/lens1_4123_123.jpg
     filename = f"{PHOTO_FOLDER}/lens{lens_to_precision[save['angle']]}_{width_x}_{height_y}.jpg"
-    with open(filename, "wb") as img_file:
-        img_file.write(image_data)          # or not?
-    # return image_data, filename # !!!!!!!!!
-    # if DEBUG:
-    #     print(f"[TAKE_PHOTO] Filename: {filename}")
-    return filename # !!!!!!!!!
+    # The disk copy is only an archive: the stitchers get the bytes in memory
+    ARCHIVE.write(filename, image_data)
+    RECENT.add(filename, image_data)
+    return filename, image_data
+
+def take_photo(): 
+    """Capture an image and save it with coordinates as the name."""
+    filename, image_data = capture_photo()
+    return filename
 
 
 ''' Only for debugging reasons '''
@@ -50,23 +59,30 @@ def simulation(simulation,speed):
             "is_network_simulation" : simulation, 
             "user_speed_multiplier" : speed
         }
-    response = requests.put(f"{MELVIN_BASE_URL}/simulation", params=payload)
+    response = melvin_client.put("/simulation", params=payload)
     return
 
 
-''' Get MELVIN status '''
-def get_observation():
-    """Retrieve MELVIN's observation data."""
-    try:
-        # print(f"[DEBUG] Sending GET request to {MELVIN_BASE_URL}/observation")
-        response = requests.get(f"{MELVIN_BASE_URL}/observation")
-        # print(f"[DEBUG] Response status code: {response.status_code}")
-        response.raise_for_status()
-        # print(f"[DEBUG] Response JSON: {response.json()}")
-        return response.json()
-    except Exception as e:
-        print(f"[ERROR] Failed to fetch observation data: {str(e)}")
-        return get_observation()
+''' Get MELVIN status
+@params
+max_age: maximum age in seconds of the returned observation
+'''
+OBSERVATION_INTERVAL = 0.5 # Seconds between two polls of /observation by the telemetry thread
+OBSERVATION_MAX_AGE = 2 # Older snapshots are not returned, the caller waits for a fresh one
+
+def fetch_observation():
+    """Send a single /observation request."""
+    response = melvin_client.get("/observation")
+    response.raise_for_status()
+    return response.json()
+
+TELEMETRY = TelemetryCache(fetch_observation, OBSERVATION_INTERVAL)
+
+def get_observation(max_age=OBSERVATION_MAX_AGE):
+    """Retrieve MELVIN's observation data from the shared telemetry snapshot."""
+    # The telemetry thread retries failed polls by itself, this only waits for a fresh enough snapshot
+    observation, received = TELEMETRY.latest(max_age)
+    return dict(observation)
 
 
 ''' Control MELVIN's speed and camera angle
@@ -76,31 +92,60 @@ x: velocity x axis
 y: velocity y axis
 angle: wide, narrow, normal
 '''
-def set_mode(mode, x, y, angle):
-    """Set MELVIN's mode (e.g., acquisition or safe)."""
+def put_control(mode, x, y, angle):
+    """Send a single PUT /control request."""
     payload = {"state": mode, "vel_x": x, "vel_y": y, "camera_angle": angle}
-    response = requests.put(f"{MELVIN_BASE_URL}/control", json=payload)
+    response = melvin_client.put("/control", json=payload)
     response.raise_for_status()
 
+TRANSITIONS = ModeTransitionManager(TELEMETRY, put_control)
+
+def set_mode(mode, x, y, angle):
+    """Set MELVIN's mode (e.g., acquisition or safe)."""
+    put_control(mode, x, y, angle)
+    TRANSITIONS.sent(mode)
+
 
 ''' Function to make sure MELVIN changed to desired mode
 @params
 new: desired new mode
+deadline: time.monotonic() value after which we stop waiting, None to wait until it happens
 '''
-def wait(new):
-    while True:
-        check_wait = get_observation()
-        set_mode(new, check_wait["vx"], check_wait["vy"], check_wait["angle"])
-
-        if check_wait["state"] == new:
-            break
-        if check_wait["state"] == "safe":
-            safe()
-            break
-        time.sleep(0.3)
+def wait(new, deadline=None):
+    # The mode change is sent once, and again only if melvin shows no sign of it for a while
+    check_wait = TRANSITIONS.await_mode(new, deadline)
+    if check_wait["state"] == "safe" and new != "safe":
+        safe()
     return
 
 
+''' Change MELVIN's velocity in acquisition mode and wait until it reports it
+@params
+vx: desired velocity x axis
+vy: desired velocity y axis
+angle: wide, narrow, normal
+battery: battery threshold checked with protect_battery on every new observation, None for no check
+prev_mode: mode safe and protect_battery return to after handling an anomaly
+'''
+def await_velocity(vx, vy, angle, battery=None, prev_mode="acquisition"):
+    # The command is sent once, then every check runs on an observation received after the previous one
+    TRANSITIONS.request("acquisition", vx, vy, angle)
+    sent_at = TRANSITIONS.requested_at
+    observation, received = TELEMETRY.wait_newer(sent_at)
+    while observation["vx"] != vx or observation["vy"] != vy:
+        safe(prev_mode)
+        if battery is not None:
+            protect_battery(battery, angle, prev_mode)
+        ignored = (observation["state"] not in ("acquisition", TRANSITION_STATE)
+                   and time.monotonic() - sent_at >= TRANSITIONS.reissue_timeout)
+        if TRANSITIONS.requested_at != sent_at or ignored:
+            # Another mode was set meanwhile (e.g. charging, which restores the old velocity) or no sign of ours
+            TRANSITIONS.request("acquisition", vx, vy, angle)
+            sent_at = TRANSITIONS.requested_at
+        observation, received = TELEMETRY.wait_newer(received)
+    return dict(observation)
+
+
 ''' Make sure MELVIN never enters safe mode 
 @params
 prev_mode: mode it had before entering safe mode -> in order to set this mode before returning
@@ -173,7 +218,7 @@ def protect_battery(x, angle="wide", prev_mode="acquisition"):
 def get_slots():
     try:
         #print(f"[DEBUG] Sending GET request to {MELVIN_BASE_URL}/slots")
-        response = requests.get(f"{MELVIN_BASE_URL}/slots")
+        response = melvin_client.get("/slots")
         #print(f"[DEBUG] Response status code: {response.json}")
         response.raise_for_status()
         #print(f"[DEBUG] Response JSON: {response.json()}")
@@ -222,7 +267,7 @@ def book_slot(slot_id):
                 "slot_id" : slot_id,
                 "enabled" : True
             }
-        response = requests.put(f"{MELVIN_BASE_URL}/slots",params=payload)
+        response = melvin_client.put("/slots",params=payload)
         
         #print(f"[DEBUG] Response status code: {response.status_code}")
         response.raise_for_status()
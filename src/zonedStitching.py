@@ -1,6 +1,9 @@
 import cv2 as cv
 import numpy as np
 import os
+from photo_pipeline import RECENT, decode_photo, resize_plan
+from quality_layer import photo_quality
+from toroidal_paste import blocks, paste
 
 DEBUG = False
 
@@ -86,9 +89,13 @@ Stitch images from a list of filenames onto the canvas.
     canvas: The canvas numpy array
     stitched_images: Dictionary to track stitched images
     origin: Tuple (x, y) of the canvas origin in the global coordinate system
+    images: Optional dictionary filename -> encoded bytes or decoded image, looked up before the disk
+    quality: Optional quality layer of the canvas (see quality_layer), a pixel is only replaced by a better one
 '''
-def stitch_from_filenames(image_dir, filenames, canvas, stitched_images, origin):
+def stitch_from_filenames(image_dir, filenames, canvas, stitched_images, origin, images=None, quality=None):
     lens_size = {'1': 1000, '8': 800, '6': 600}  # Wide, normal, narrow
+    if quality is None:
+        quality = np.zeros(canvas.shape[:2], dtype=np.uint8)
     
     # Origin point
     origin_x, origin_y = origin
@@ -116,14 +123,19 @@ def stitch_from_filenames(image_dir, filenames, canvas, stitched_images, origin)
                     print(f"Image {position_key} already stitched, skipping")
                 continue
             
-            # Load the image
+            # Load the image: given in memory, then recently taken, then from disk
             img_path = os.path.join(image_dir, filename)
-            if not os.path.exists(img_path):
-                if DEBUG:
-                    print(f"Image file not found: {img_path}")
-                continue
-                
-            img = cv.imread(img_path)
+            img = images.get(filename) if images is not None else None
+            if img is None:
+                img = RECENT.get(filename)
+            if isinstance(img, (bytes, bytearray)):
+                img = decode_photo(img)
+            elif img is None:
+                if not os.path.exists(img_path):
+                    if DEBUG:
+                        print(f"Image file not found: {img_path}")
+                    continue
+                img = cv.imread(img_path)
             if img is None:
                 if DEBUG:
                     print(f"Failed to load image: {img_path}")
@@ -132,7 +144,8 @@ def stitch_from_filenames(image_dir, filenames, canvas, stitched_images, origin)
             # Resize image based on lens type if needed
             if lens_precision in lens_size:
                 current_lens_size = lens_size[lens_precision]
-                img = cv.resize(img, (current_lens_size, current_lens_size))
+                plan = resize_plan(current_lens_size)
+                img = plan.resize(img, plan.buffer()) # Pooled, paste_best copies it right away
             
             # Get image dimensions
             h, w = img.shape[:2]
@@ -141,56 +154,27 @@ def stitch_from_filenames(image_dir, filenames, canvas, stitched_images, origin)
             canvas_x = global_x - origin_x -w // 2
             canvas_y = global_y - origin_y - h // 2
             
-            # Handle edge cases where the image extends beyond the canvas
-            if canvas_x < 0 or canvas_y < 0 or canvas_x + w > canvas_width or canvas_y + h > canvas_height:
-                # Calculate the region of the image that fits within the canvas
-                start_x = max(0, -canvas_x)
-                start_y = max(0, -canvas_y)
-                end_x = min(w, canvas_width - canvas_x)
-                end_y = min(h, canvas_height - canvas_y)
-                
-                # Calculate the valid region on the canvas
-                valid_canvas_x = max(0, canvas_x)
-                valid_canvas_y = max(0, canvas_y)
-                
-                # Extract the valid portion of the image
-                valid_img = img[start_y:end_y, start_x:end_x]
-                valid_h, valid_w = valid_img.shape[:2]
-                
-                # Check that dimensions are valid before attempting to place the image
-                if valid_h > 0 and valid_w > 0:
-                    if DEBUG:
-                        print(f"Placing partial image {position_key} at canvas coordinates ({valid_canvas_x}, {valid_canvas_y}) with size {valid_w}x{valid_h}")
-                    canvas[valid_canvas_y:valid_canvas_y+valid_h, valid_canvas_x:valid_canvas_x+valid_w] = valid_img
-                    
-                    # Store the actual position and image in the dictionary
-                    stitched_images[position_key] = {
-                        'x': global_x,
-                        'y': global_y,
-                        'canvas_x': valid_canvas_x,
-                        'canvas_y': valid_canvas_y,
-                        'width': valid_w,
-                        'height': valid_h,
-                        'filename': filename
-                    }
-                elif DEBUG:
-                    print(f"Warning: Invalid dimensions for image region - w:{valid_w}, h:{valid_h}")
-            else:
-                # Normal case - place the entire image
+            # The zone is not a torus: the parts of the image outside its canvas are clipped
+            placed = blocks(canvas_x, canvas_y, w, h, canvas_width, canvas_height, wrap=False)
+            if not placed:
                 if DEBUG:
-                    print(f"Placing full image {position_key} at canvas coordinates ({canvas_x}, {canvas_y}) with size {w}x{h}")
-                canvas[canvas_y:canvas_y+h, canvas_x:canvas_x+w] = img
-                
-                # Store the position and image in the dictionary
-                stitched_images[position_key] = {
-                    'x': global_x,
-                    'y': global_y,
-                    'canvas_x': canvas_x,
-                    'canvas_y': canvas_y,
-                    'width': w,
-                    'height': h,
-                    'filename': filename
-                }
+                    print(f"Warning: Image {position_key} lies outside the canvas")
+                continue
+            valid_canvas_x, valid_canvas_y, _, _, valid_w, valid_h = placed[0]
+            if DEBUG:
+                print(f"Placing image {position_key} at canvas coordinates ({valid_canvas_x}, {valid_canvas_y}) with size {valid_w}x{valid_h}")
+            paste(canvas, img, canvas_x, canvas_y, wrap=False, quality=quality, img_quality=photo_quality(h, w))
+            
+            # Store the actual position and image in the dictionary
+            stitched_images[position_key] = {
+                'x': global_x,
+                'y': global_y,
+                'canvas_x': valid_canvas_x,
+                'canvas_y': valid_canvas_y,
+                'width': valid_w,
+                'height': valid_h,
+                'filename': filename
+            }
                 
         except Exception as e:
             print(f"Error processing image {filename}: {e}")
@@ -212,8 +196,10 @@ def get_zoned_bytes(canvas, format='.jpg', quality=85):
     top_left: (x_min, y_min) coordinates of the top left corner
     bottom_right: (x_max, y_max) coordinates of the bottom right corner
     specific_files: the list of the desired image names to look for
+    final_name: path of the stitched objective image
+    images: optional dictionary name -> encoded bytes or decoded image (otherwise the recent photos, then ./images)
 '''
-def stitch_zoned(top_left, bottom_right, specific_files, final_name):
+def stitch_zoned(top_left, bottom_right, specific_files, final_name, images=None):
     # Directory containing the images
     image_dir = "./images"
     
@@ -221,7 +207,7 @@ def stitch_zoned(top_left, bottom_right, specific_files, final_name):
     canvas, stitched_images, origin = create_dynamic_canvas(top_left, bottom_right)
     
     # Stitch the images
-    stitch_from_filenames(image_dir, specific_files, canvas, stitched_images, origin)
+    stitch_from_filenames(image_dir, specific_files, canvas, stitched_images, origin, images)
     if DEBUG:
         print(f"Successfully stitched {len(stitched_images)} images")
     